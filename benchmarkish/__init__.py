@@ -39,6 +39,31 @@ MEANTIME_L = "AVG TIME"
 MAXTIME_L = "MAX TIME"
 MINTIME_L = "MIN TIME"
 MIDTIME_L = "MEDIAN TIME"
+MEANNOISE_L = "AVG NOISE%"
+MAXNOISE_L = "MAX NOISE%"
+MEANSTEAL_L = "AVG STEAL%"
+MEANFREQ_L = "AVG FREQ"
+NOISYRUNS_L = "NOISY RUNS"
+SPAWNOVERHEAD_L = "SPAWN OVERHEAD"
+SPAWNMETHOD_L = "SPAWN METHOD"
+STAGES_L = "PIPELINE STAGES"
+STAGE_L = "STAGE"
+STAGECMD_L = "COMMAND"
+LIFETIME_L = "LIFETIME"
+PHASES_L = "PHASES"
+RUN_L = "RUN"
+PHASE_L = "PHASE"
+START_L = "START"
+END_L = "END"
+SERIESTIME_L = "TIME"
+CPUSERIES_L = "CPU"
+MEMSERIES_L = "MEM"
+MINORFAULTS_L = "MINOR FAULTS"
+MAJORFAULTS_L = "MAJOR FAULTS"
+CACHEMODE_L = "CACHE MODE"
+CACHE_L = "PAGE CACHE"
+COLD_L = "COLD"
+WARM_L = "WARM"
 PROCENV_L = "ENVIRONMENT"
 ENV_L = "SYSTEM SPECS"
 
@@ -59,6 +84,28 @@ MEANTIME_I = "total_time"
 MAXTIME_I = "max_time"
 MINTIME_I = "min_time"
 MIDTIME_I = "mid_time"
+MEANNOISE_I = "avg_noise"
+MAXNOISE_I = "max_noise"
+MEANSTEAL_I = "avg_steal"
+MEANFREQ_I = "avg_freq"
+NOISY_I = "noisy"
+NOISYRUNS_I = "noisy_runs"
+SPAWNOVERHEAD_I = "spawn_overhead"
+SPAWNMETHOD_I = "spawn_method"
+STAGES_I = "stages"
+STAGE_I = "index"
+STAGECMD_I = "command"
+LIFETIME_I = "lifetime"
+PHASES_I = "phases"
+PHASE_I = "index"
+START_I = "start"
+END_I = "end"
+CPUSERIES_I = "cpu_series"
+MEMSERIES_I = "mem_series"
+MINORFAULTS_I = "minor_faults"
+MAJORFAULTS_I = "major_faults"
+CACHEMODE_I = "cache_mode"
+CACHE_I = "cache"
 DETAILS_I = "details"
 PROCENV_I = "environ"
 ENV_I = "envstats"
@@ -74,3 +121,6 @@ STARTCPU_I = "USAGE PERCENTAGE @STARTUP"
 RAWMEM_I = "RAW TOTAL MEMORY"
 TOTALMEM_I = "TOTAL MEMORY"
 AVAILABLEMEM_I = "AVAILABLE MEMORY @STARTUP"
+CPUGOVERNOR_I = "CPU GOVERNOR"
+CPUBOOST_I = "CPU FREQUENCY BOOST"
+CPUFREQ_I = "CPU FREQUENCY @STARTUP"
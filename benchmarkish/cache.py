@@ -0,0 +1,72 @@
+import os
+
+from benchmarkish import *
+
+COLD_C = "cold"
+WARM_C = "warm"
+ALTERNATE_C = "alternate"
+SEPARATE_C = "separate"
+CACHE_MODES = [COLD_C, ALTERNATE_C, SEPARATE_C]
+
+READ_CHUNK = 1024 * 1024
+
+
+def cache_state(mode, index, execnum):
+    # Which page cache state run #index must start from
+    if not mode:
+        return None
+    if mode == COLD_C:
+        return COLD_C
+    if mode == ALTERNATE_C:
+        return COLD_C if index % 2 == 0 else WARM_C
+    # separate: the first half cold, then the warm runs
+    return COLD_C if index < (execnum + 1) // 2 else WARM_C
+
+
+def _walk(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                for name in files:
+                    yield os.path.join(root, name)
+        else:
+            yield path
+
+
+def evict_files(paths):
+    if not hasattr(os, 'posix_fadvise'):
+        logger.warning("posix_fadvise isn't available here. Files can't be evicted, use --prepare instead")
+        return 0
+    evicted = 0
+    for path in _walk(paths):
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            logger.exception(f"Can't open {path} for eviction")
+            continue
+        try:
+            # Dirty pages aren't dropped by DONTNEED: write them back first
+            try:
+                os.fdatasync(fd)
+            except OSError:
+                pass
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            evicted += 1
+        except OSError:
+            logger.exception(f"Can't evict {path} from the page cache")
+        finally:
+            os.close(fd)
+    return evicted
+
+
+def warm_files(paths):
+    warmed = 0
+    for path in _walk(paths):
+        try:
+            with open(path, mode='rb', buffering=0) as f:
+                while f.read(READ_CHUNK):
+                    pass
+            warmed += 1
+        except OSError:
+            logger.exception(f"Can't read {path} into the page cache")
+    return warmed
@@ -1,6 +1,9 @@
 import argparse
 
+from benchmarkish.cache import CACHE_MODES
+from benchmarkish.format import parse_size
 from benchmarkish.main import execute_benchmarkish
+from benchmarkish.system import Isolation
 
 
 def resolve_args():
@@ -38,6 +41,35 @@ def resolve_args():
                    help="Define which percentage of the results to trim to elaborate the trimmed stats")
     p.add_argument('--details', default=False, action='store_true',
                    help="Dumps informations specific to every single run inside the report")
+    p.add_argument('--noisethreshold', type=float,
+                   help="Flags a run when the average system load not caused by the command (steal time included) "
+                        "exceeds this percentage")
+    p.add_argument('--noiseretries', type=int, default=0,
+                   help="How many times a run flagged by --noisethreshold is executed again before keeping it")
+    p.add_argument('--rlimitcpu', type=int,
+                   help="Limits the CPU time of every run to this many seconds (setrlimit, POSIX only)")
+    p.add_argument('--rlimitmem', type=parse_size,
+                   help="Limits the address space of every run, e.g. 512M (setrlimit, POSIX only)")
+    p.add_argument('--cgroupcpu', type=float,
+                   help="Contains every run in a cgroup v2 allowed to use this many CPUs, e.g. 1.5 (when permitted)")
+    p.add_argument('--cgroupmem', type=parse_size,
+                   help="Contains every run in a cgroup v2 with this memory.max, e.g. 1G (when permitted)")
+    p.add_argument('--calibration', type=int, default=10,
+                   help="How many no-op commands are launched to measure the spawn overhead, which is then "
+                        "subtracted from every run time. 0 disables the calibration")
+    p.add_argument('--timeseries', type=int, default=0,
+                   help="Downsamples the cpu and memory samples of every run to at most this many points (LTTB) and "
+                        "writes them in the report for charts. Implies --details")
+    p.add_argument('--cachemode', choices=CACHE_MODES,
+                   help="Runs the command with a cold page cache (cold), alternating cold and warm runs (alternate) or "
+                        "the first half cold and the rest warm (separate). Cold and warm stats are reported side by "
+                        "side. Needs --coldfiles or --prepare")
+    p.add_argument('--coldfiles', nargs='+',
+                   help="Files or directories evicted from the page cache (posix_fadvise DONTNEED) before every cold "
+                        "run and read back before every warm run")
+    p.add_argument('--prepare', type=str,
+                   help="Executes this command before every cold run, which isn't benchmarked. e.g.: "
+                        "sh -c 'sync; echo 3 > /proc/sys/vm/drop_caches'")
     return vars(p.parse_args())
 
 
@@ -46,7 +78,9 @@ def main():
     execute_benchmarkish(
         argv['command'], argv['n'], argv['pname'], argv['testname'], argv['envname'], argv['append'], argv['xlsx'],
         argv['json'], argv['postcmd'], argv['failfast'], argv['postfailfast'], argv['environ'], argv['trim'],
-        argv['details']
+        argv['details'], argv['noisethreshold'], argv['noiseretries'],
+        Isolation(argv['rlimitcpu'], argv['rlimitmem'], argv['cgroupcpu'], argv['cgroupmem']), argv['calibration'],
+        argv['timeseries'], argv['cachemode'], argv['coldfiles'], argv['prepare']
     )
 
 
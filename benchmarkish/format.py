@@ -6,3 +6,30 @@ def get_size(nbytes, suffix="B"):
         nbytes /= factor
     # This shouldn't happen on real systems, but you can never be sure (2020, btw)
     return f"{nbytes:.2f}{unit}{suffix}"
+
+
+def parse_size(size: str) -> int:
+    # Inverse of get_size: "512M", "1.5GB", "2048" -> bytes
+    units = {"": 0, "K": 1, "M": 2, "G": 3, "T": 4, "P": 5}
+    value = size.strip().upper()
+    if value.endswith("B"):
+        value = value[:-1]
+    unit = value[-1:] if value[-1:] in units else ""
+    number = value[:len(value) - len(unit)]
+    return int(float(number) * (1024 ** units[unit]))
+
+
+def format_metric(metric) -> str:
+    if metric.value is None:
+        return "n/a"
+    if metric.unit == "B":
+        return get_size(metric.value)
+    if metric.unit == "%":
+        return f"{metric.value:.2f}%"
+    if metric.unit == "s":
+        return f"{metric.value:.2f} s" if metric.value >= 1 else f"{metric.value * 1000:.2f} ms"
+    if metric.unit == "count":
+        return f"{metric.value:.0f}"
+    if metric.unit == "MHz":
+        return f"{metric.value:.0f}MHz"
+    return f"{metric.value} {metric.unit}"
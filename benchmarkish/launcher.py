@@ -0,0 +1,270 @@
+import os
+import shlex
+import shutil
+import signal
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+from benchmarkish import *
+
+POSIX_SPAWN_M = "posix_spawn"
+POPEN_M = "popen"
+
+SHELL_OPERATORS = {"&&", ";", "&", ">", ">>", "<", "2>", "2>&1"}
+
+# Waiting with WNOWAIT tells when the process exits without reaping it, so the sampler can still read the zombie
+USE_WAITID = hasattr(os, 'waitid') and hasattr(os, 'WNOWAIT')
+USE_POSIX_SPAWN = hasattr(os, 'posix_spawnp') and sys.platform != 'win32'
+
+
+def split_pipeline(command: str):
+    # Splits on the pipes outside of quotes. Every stage is tokenized on its own (POSIX only, Windows gets the raw
+    # stage strings)
+    stages = []
+    current = []
+    quote = None
+    escaped = False
+    for n, char in enumerate(command):
+        if escaped:
+            escaped = False
+        elif char == '\\' and quote != "'":
+            escaped = True
+        elif quote:
+            if char == quote:
+                quote = None
+        elif char in "'\"":
+            quote = char
+        elif char == '|':
+            if command[n + 1:n + 2] in ('|', '&'):
+                raise ValueError(f"'|{command[n + 1]}' isn't supported, only plain pipes are. Wrap the command in "
+                                 f"sh -c '...' to use it: {command}")
+            stages.append("".join(current))
+            current = []
+            continue
+        current.append(char)
+    stages.append("".join(current))
+    if sys.platform == 'win32':
+        stages = [stage.strip() for stage in stages]
+    else:
+        stages = [shlex.split(stage) for stage in stages]
+        for stage in stages:
+            for token in stage:
+                if token in SHELL_OPERATORS:
+                    logger.warning(f"'{token}' is passed to {stage[0]} as an argument. Only pipes are interpreted, "
+                                   f"wrap the command in sh -c '...' for anything else")
+    if any(not stage for stage in stages):
+        raise ValueError(f"Empty stage in pipeline: {command}")
+    return stages
+
+
+def _exitcode(status):
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def _fileno(target):
+    return target if isinstance(target, int) else target.fileno()
+
+
+class LaunchedProcess:
+    # Starts the command and timestamps it from right before the spawn to the moment it exits.
+    # posix_spawn is used when nothing has to run between fork and exec, Popen otherwise
+
+    def __init__(self, command, stdout, stdin=None, stderr=None, on_exit=None, **popen_kwargs):
+        self.command = command
+        self.returncode = None
+        self.rusage = None
+        self.ended = None
+        self.exited = threading.Event()
+        self._on_exit = on_exit
+        # A spawned pid has no Popen to wait on, its exit can only be watched with waitid
+        if USE_POSIX_SPAWN and USE_WAITID and not popen_kwargs:
+            self.method = POSIX_SPAWN_M
+            self._popen = None
+            outfd = _fileno(stdout)
+            errfd = _fileno(stderr if stderr is not None else stdout)
+            actions = [(os.POSIX_SPAWN_DUP2, outfd, 1), (os.POSIX_SPAWN_DUP2, errfd, 2)]
+            if stdin is not None:
+                actions.append((os.POSIX_SPAWN_DUP2, _fileno(stdin), 0))
+            self.started = time.perf_counter()
+            self.pid = os.posix_spawnp(command[0], command, os.environ, file_actions=actions)
+        else:
+            self.method = POPEN_M
+            self.started = time.perf_counter()
+            self._popen = subprocess.Popen(command, stdin=stdin, stdout=stdout,
+                                           stderr=stderr if stderr is not None else subprocess.STDOUT, **popen_kwargs)
+            self.pid = self._popen.pid
+        threading.Thread(target=self._watch, daemon=True).start()
+
+    def _watch(self):
+        try:
+            if USE_WAITID:
+                os.waitid(os.P_PID, self.pid, os.WEXITED | os.WNOWAIT)
+            elif sys.platform != 'win32':
+                self._reap()
+            else:
+                self.returncode = self._popen.wait()
+        except ChildProcessError:
+            pass
+        self.ended = time.perf_counter()
+        self.exited.set()
+        if self._on_exit:
+            self._on_exit()
+
+    def _reap(self):
+        # The watcher is the only reaper here: wait() takes the status and the rusage from it. Blocking, so it costs
+        # nothing the noise sampling would see
+        if hasattr(os, 'wait4'):
+            _, status, rusage = os.wait4(self.pid, 0)
+        else:
+            (_, status), rusage = os.waitpid(self.pid, 0), None
+        self._reaped(status, rusage)
+
+    def _reaped(self, status, rusage):
+        self.rusage = rusage
+        self.returncode = _exitcode(status)
+        if self._popen:
+            self._popen.returncode = self.returncode
+
+    @property
+    def elapsed(self):
+        return self.ended - self.started
+
+    def kill(self):
+        # Only while it's still ours: once reaped, the pid may belong to someone else
+        if self.returncode is not None:
+            return
+        try:
+            if self._popen:
+                self._popen.kill()
+            else:
+                os.kill(self.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    def wait(self):
+        if not USE_WAITID:
+            self.exited.wait()
+        if self.returncode is not None:
+            return self.returncode
+        if hasattr(os, 'wait4'):
+            # Reaping it ourselves is the only way to get its rusage (page faults, exact cpu times)
+            _, status, rusage = os.wait4(self.pid, 0)
+            self._reaped(status, rusage)
+        else:
+            self.returncode = self._popen.wait()
+        self.exited.wait()
+        return self.returncode
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.wait()
+
+
+class LaunchedPipeline:
+    # Every stage is launched with its pipes wired to the next one. stderr of every stage and stdout of the last one
+    # go to the output file. A single command is a pipeline with one stage
+
+    def __init__(self, stages, stdout, **popen_kwargs):
+        self.ended = None
+        self.exited = threading.Event()
+        # Set whenever any stage exits, so the sampler can take its last sample right away
+        self.changed = threading.Event()
+        self._running = len(stages)
+        self._lock = threading.Lock()
+        self.stages = []
+        stdin = None
+        readfd = None
+        try:
+            for n, command in enumerate(stages):
+                last = n == len(stages) - 1
+                readfd, writefd = (None, None) if last else os.pipe()
+                try:
+                    self.stages.append(LaunchedProcess(command, stdout if last else writefd, stdin, stdout,
+                                                       self._stage_exited, **popen_kwargs))
+                finally:
+                    # The children have their own copies now. Keeping ours open would hide the EOF
+                    if stdin is not None:
+                        os.close(stdin)
+                        stdin = None
+                    if writefd is not None:
+                        os.close(writefd)
+                stdin, readfd = readfd, None
+        except BaseException:
+            # Only the fds still owned here: a double close could hit one another thread just got
+            for fd in (stdin, readfd):
+                if fd is not None:
+                    os.close(fd)
+            # The stages already started could wait forever on a pipe nobody reads, or on the inherited stdin
+            for stage in self.stages:
+                stage.kill()
+            self.wait()
+            raise
+        self.started = self.stages[0].started
+
+    def _stage_exited(self):
+        with self._lock:
+            self._running -= 1
+            if not self._running:
+                self.ended = time.perf_counter()
+                self.exited.set()
+        self.changed.set()
+
+    @property
+    def pid(self):
+        return self.stages[0].pid
+
+    @property
+    def method(self):
+        return self.stages[0].method
+
+    @property
+    def elapsed(self):
+        return self.ended - self.started
+
+    def wait(self):
+        for stage in self.stages:
+            stage.wait()
+        return self.stages[-1].returncode if self.stages else None
+
+    def page_faults(self):
+        # (minor, major) summed over the stages, None when the platform can't tell
+        if any(stage.rusage is None for stage in self.stages):
+            return None, None
+        return (sum(stage.rusage.ru_minflt for stage in self.stages),
+                sum(stage.rusage.ru_majflt for stage in self.stages))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.wait()
+
+
+def noop_command():
+    if sys.platform == 'win32':
+        return f'"{os.environ.get("COMSPEC", "cmd.exe")}" /c rem'
+    return [shutil.which('true') or 'true']
+
+
+def calibrate_spawn(runs, **popen_kwargs):
+    # Median time to launch and reap a command that does nothing. That much of every run is the launcher, not the
+    # command
+    samples = []
+    with open(os.devnull, mode='w') as devnull:
+        for _ in range(0, runs):
+            with LaunchedProcess(noop_command(), devnull, **popen_kwargs) as proc:
+                pass
+            samples.append(proc.elapsed)
+    if not samples:
+        return 0.0
+    overhead = statistics.median(samples)
+    logger.info(f"Spawn overhead over {runs} no-op runs: {overhead * 1000:.3f} ms "
+                f"(min {min(samples) * 1000:.3f} ms, max {max(samples) * 1000:.3f} ms)")
+    return overhead
@@ -2,19 +2,24 @@ import datetime
 import os
 import platform
 import shlex
-import statistics
 import subprocess
 import sys
 import time
-from collections import OrderedDict, namedtuple
-from typing import List
+from collections import OrderedDict
+from typing import Optional
 
 import psutil
 
 from benchmarkish import *
+from benchmarkish.cache import COLD_C, WARM_C, cache_state, evict_files, warm_files
 from benchmarkish.format import get_size
-from benchmarkish.model import PsRunInfo
+from benchmarkish.launcher import LaunchedPipeline, calibrate_spawn, split_pipeline
+from benchmarkish.model import CpuTimes, PsRunInfo
+from benchmarkish.processor import process_data
 from benchmarkish.report import report_json, report_logger, report_xlsx
+from benchmarkish.result import SECONDS_U, Metric, SuiteResult
+from benchmarkish.system import SYSTEM_SAMPLE_WINDOW, Isolation, check_cpu_scaling, prime_system_sampler, \
+    sample_system
 
 
 def collect_envdata():
@@ -32,6 +37,7 @@ def collect_envdata():
     udict[PHYCORES_I] = psutil.cpu_count(logical=False)
     udict[LOGCORES_I] = psutil.cpu_count(logical=True)
     udict[STARTCPU_I] = psutil.cpu_percent(interval=1.0)
+    udict.update(check_cpu_scaling())
 
     # mem info
     vmem = psutil.virtual_memory()
@@ -48,124 +54,114 @@ def collect_envdata():
     return udict
 
 
-def collectdata(pid, info: PsRunInfo, collect_environ: bool = False):
-    if not pid:
+def collectdata(process: LaunchedPipeline, info: PsRunInfo, collect_environ: bool = False):
+    if not process.pid:
         logger.exception("nopid")
         return 1
 
+    ncores = psutil.cpu_count() or 1
+    info.stages = [PsRunInfo(n, " ".join(map(shlex.quote, stage.command)) if isinstance(stage.command, list)
+                             else stage.command)
+                   for n, stage in enumerate(process.stages)]
+    running = []
     try:
-        pswatcher = psutil.Process(pid)
+        for stage, stageinfo in zip(process.stages, info.stages):
+            try:
+                pswatcher = psutil.Process(stage.pid)
+                # Both the process and the system percentages are relative to the previous call: the first one is a
+                # baseline
+                pswatcher.cpu_percent()
+            except psutil.NoSuchProcess:
+                # Without waitid the launcher may have reaped it already. Its times come from the rusage
+                logger.info("No such process, stage not watched")
+                continue
+            running.append((stage, pswatcher, stageinfo))
     except KeyboardInterrupt as ki:
         raise ki
     except Exception:
         logger.exception("Couldn't collect data")
         return 1
-    start = datetime.datetime.now()
+    prime_system_sampler()
+    last_system = time.perf_counter()
     try:
-        while 1:
-            time.sleep(0.2)
-            # Talking about WSL, as_dict throws KeyError there. We must take the slower approach
-            info.add_cpu_perc(pswatcher.cpu_percent())
-            info.add_mem_perc(pswatcher.memory_percent())
-            info.last_cpu_times = pswatcher.cpu_times()
-            if collect_environ:
-                info.environ = pswatcher.environ()
-
-            status = pswatcher.status()
-            if status == psutil.STATUS_ZOMBIE:
-                # Since we're running inside the popen context, the process WILL remain [DECEASED] on Linux
-                # On Windows NoSuchProcess is thrown instead
-                logger.info("Zombie process, loop interrupted")
-                break
+        # At least one sample, even when every stage is gone already
+        sampled = False
+        while running or not sampled:
+            sampled = True
+            # Wakes up as soon as a stage exits, so its last sample is taken on the fresh zombie
+            process.changed.wait(0.2)
+            process.changed.clear()
+            cpuperc = 0.0
+            memperc = 0.0
+            for stage, pswatcher, stageinfo in list(running):
+                exited = stage.exited.is_set()
+                try:
+                    # Talking about WSL, as_dict throws KeyError there. We must take the slower approach
+                    stagecpu = pswatcher.cpu_percent()
+                    stagemem = pswatcher.memory_percent()
+                    stageinfo.last_cpu_times = pswatcher.cpu_times()
+                    status = pswatcher.status()
+                except psutil.NoSuchProcess:
+                    # On Windows NoSuchProcess is thrown instead of finding a zombie
+                    logger.info("No such process, stage no longer watched")
+                    running.remove((stage, pswatcher, stageinfo))
+                    continue
+                stageinfo.add_cpu_perc(stagecpu)
+                stageinfo.add_mem_perc(stagemem)
+                if collect_environ and stageinfo.index == 0:
+                    try:
+                        info.environ = pswatcher.environ()
+                    except psutil.Error:
+                        # A zombie has no environment left, the one read on a previous sample is kept
+                        pass
+                cpuperc += stagecpu
+                memperc += stagemem
+                if exited or status == psutil.STATUS_ZOMBIE:
+                    # Since we're running inside the launcher context, the process WILL remain [DECEASED] on Linux
+                    logger.info("Zombie process, stage no longer watched")
+                    running.remove((stage, pswatcher, stageinfo))
+            info.add_cpu_perc(cpuperc)
+            info.add_mem_perc(memperc)
+            now = time.perf_counter()
+            info.add_sample_time(now - process.started)
+            # Whatever keeps the system busy besides the watched processes is noise. Shorter windows are left to the
+            # next sample, a run shorter than one has no noise at all
+            if now - last_system >= SYSTEM_SAMPLE_WINDOW:
+                busy, steal, freq = sample_system()
+                info.add_system_sample(max(0.0, busy - cpuperc / ncores), steal, freq)
+                last_system = now
     except KeyboardInterrupt as ki:
         raise ki
-    except psutil.NoSuchProcess:
-        logger.info("No such process, loop interrupted")
     except Exception:
         logger.exception("Loop interrupted")
 
-    end = datetime.datetime.now()
-    info.totaltime = (end - start) / datetime.timedelta(seconds=1)
+    process.exited.wait()
+    info.totaltime = process.elapsed
+    for stage, stageinfo in zip(process.stages, info.stages):
+        stageinfo.totaltime = stage.elapsed
+        if stageinfo.last_cpu_times is None and stage.rusage is not None:
+            # Reaped before its first sample (no waitid here), the rusage has the times the sampler missed
+            stageinfo.last_cpu_times = CpuTimes(stage.rusage.ru_utime, stage.rusage.ru_stime)
+    cputimes = [stageinfo.last_cpu_times for stageinfo in info.stages if stageinfo.last_cpu_times]
+    if cputimes:
+        info.last_cpu_times = CpuTimes(sum(t.user for t in cputimes), sum(t.system for t in cputimes))
     return 0
 
 
-def process_data(infos: List[PsRunInfo], vmem, trimvalue, is_detailed, is_environ):
-    out = OrderedDict()
-    Detail = namedtuple("Detail", [MEANCPU_I, T_MEANCPU_I, MAXCPU_I, T_MAXCPU_I, MEANMEM_I, T_MEANMEM_I,
-                                   MAXMEM_I, T_MAXMEM_I, CPUTIME_I, SYSCPUTIME_I, TIME_I])
-    details = []
-    entries = 0
-    avgcpusum = 0
-    travgcpusum = 0
-    maxcpusum = 0
-    maxtrcpusum = 0
-    avgmemsum = 0
-    travgmemsum = 0
-    maxmemsum = 0
-    maxtrmemsum = 0
-    usercputsum = 0
-    syscputsum = 0
-    timelist = []
-    totaltimesum = 0
-    for info in infos:
-        try:
-            # Extract
-            avgcpu = info.avg_cpu_perc()
-            travgcpu = info.trimmed_avg_cpu_perc(trimvalue)
-            maxcpu = info.max_cpu_perc()
-            maxtrcpu = info.max_trimmed_cpu_perc(trimvalue)
-            avgmem = info.avg_mem_perc()
-            travgmem = info.trimmed_avg_mem_perc(trimvalue)
-            maxmem = info.max_mem_perc()
-            maxtrmem = info.max_trimmed_mem_perc(trimvalue)
-            totaltime = info.totaltime
-            usercput = info.last_cpu_times.user
-            syscput = info.last_cpu_times.system
-        except KeyboardInterrupt as ki:
-            raise ki
-        except Exception:
-            logger.exception("Processing failed. Loops continue")
-            continue
-        else:
-            # Append
-            details.append(Detail(f"{avgcpu:.2f}%", f"{travgcpu:.2f}%", f"{maxcpu:.2f}%", f"{maxtrcpu:.2f}%",
-                                  get_size(avgmem * (vmem / 100)), get_size(travgmem * (vmem / 100)),
-                                  get_size(maxmem * (vmem / 100)), get_size(maxtrmem * (vmem / 100)),
-                                  usercput, syscput, f"{totaltime:.2f} s"))
-            entries += 1
-            avgcpusum += avgcpu
-            travgcpusum += travgcpu
-            maxcpusum += maxcpu
-            maxtrcpusum += maxtrcpu
-            avgmemsum += avgmem
-            travgmemsum += travgmem
-            maxmemsum += maxmem
-            maxtrmemsum += maxtrmem
-            usercputsum += usercput
-            syscputsum += syscput
-            totaltimesum += totaltime
-            timelist.append(totaltime)
-            if is_environ:
-                info.merge_environ()
-    out[RUNS_I] = entries
-    out[TRIM_I] = trimvalue
-    out[MEANCPU_I] = f"{(avgcpusum / entries):.2f}%"
-    out[T_MEANCPU_I] = f"{(travgcpusum / entries):.2f}%"
-    out[MAXCPU_I] = f"{(maxcpusum / entries):.2f}%"
-    out[T_MAXCPU_I] = f"{maxtrcpusum / entries}%"
-    out[MEANMEM_I] = get_size((vmem / 100) * (avgmemsum / entries))
-    out[T_MEANMEM_I] = get_size((vmem / 100) * (travgmemsum / entries))
-    out[MAXMEM_I] = get_size((vmem / 100) * (maxmemsum / entries))
-    out[T_MAXMEM_I] = get_size((vmem / 100) * (maxtrmemsum / entries))
-    out[CPUTIME_I] = usercputsum / entries
-    out[SYSCPUTIME_I] = syscputsum / entries
-    out[MEANTIME_I] = f"{(totaltimesum / entries):.2f} s"
-    out[MAXTIME_I] = f"{max(timelist):.2f} s"
-    out[MINTIME_I] = f"{min(timelist):.2f} s"
-    out[MIDTIME_I] = f"{statistics.median(timelist):.2f} s"
-    out[DETAILS_I] = details if is_detailed else []
-    out[PROCENV_I] = PsRunInfo.environ
-    return out
+def prepare_cache(state, cachefiles, preparecommand, out):
+    if state == COLD_C:
+        if cachefiles:
+            logger.info(f"Evicted {evict_files(cachefiles)} files from the page cache")
+        if preparecommand:
+            out.write('=' * 39 + " PREPARE " + '=' * 39 + '\n')
+            out.flush()
+            runret = subprocess.run(preparecommand, stdout=out, stderr=subprocess.STDOUT)
+            out.write('=' * 87 + '\n')
+            out.flush()
+            if runret.returncode:
+                logger.warning(f"Prepare command returned {runret.returncode}")
+    elif state == WARM_C and cachefiles:
+        warm_files(cachefiles)
 
 
 def execute_benchmarkish(
@@ -182,24 +178,43 @@ def execute_benchmarkish(
         postfailfast=False,
         fetchenviron=False,
         trim=10,
-        gatherdetails=False
-):
+        gatherdetails=False,
+        noisethreshold=None,
+        noiseretries=0,
+        isolation=None,
+        calibration=10,
+        timeseries=0,
+        cachemode=None,
+        cachefiles=None,
+        preparecommand=None
+) -> Optional[SuiteResult]:
+    try:
+        stages = split_pipeline(command)
+    except ValueError as e:
+        logger.error(e)
+        return None
+    if cachemode and not preparecommand and not (cachefiles and hasattr(os, 'posix_fadvise')):
+        # Runs labelled cold with a cache nobody emptied would be worse than no split at all
+        logger.error(f"Cache mode '{cachemode}' can't make the page cache cold: give the files to evict (--coldfiles, "
+                     f"needs posix_fadvise) or a command that drops the cache (--prepare)")
+        return None
     envdata = collect_envdata()
 
     start_time = datetime.datetime.today()
-    if sys.platform != 'win32':
-        command = list(shlex.shlex(command, punctuation_chars=True))
-        if command[0].endswith('"'):
-            command[0] = command[0].replace('"', "")
-        if command[0].endswith("'"):
-            command[0] = command[0].replace("'", "")
-    logger.info(f"Command to be executed: {command}")
+    if len(stages) > 1:
+        logger.info(f"Pipeline to be executed: {stages}")
+    else:
+        logger.info(f"Command to be executed: {stages[0]}")
     if testname:
         testname = f"{testname}_{start_time.strftime('%H%M%S')}" if extendreport else testname
     else:
         testname = start_time.strftime("%y%m%d%H%M%S")
     if postcommand and sys.platform != 'win32':
         postcommand = list(shlex.shlex(postcommand, punctuation_chars=True))
+    if preparecommand and sys.platform != 'win32':
+        preparecommand = shlex.split(preparecommand)
+    if (cachefiles or preparecommand) and not cachemode:
+        logger.warning("Files to evict and prepare command are only used with a cache mode. Ignored")
 
     if trim != 0:
         trim /= 100
@@ -209,35 +224,75 @@ def execute_benchmarkish(
         else f"{envdata[OS_I]}_{envname}/{processname}"
     os.makedirs(folder_prefix, exist_ok=True)
 
+    if isolation is None:
+        isolation = Isolation()
+    isolation.setup()
+    popen_kwargs = isolation.popen_kwargs()
+
     runinfos = []
-    for i in range(0, execnum):
-        runinfo = PsRunInfo(i)
-        try:
-            with open(f'{folder_prefix}/{processname}.{start_time.strftime("%y%m%d_%H%M%S")}.{i}.out', mode='w') as out:
-                with subprocess.Popen(command, stdout=out, stderr=subprocess.STDOUT) as subp:
-                    failed = collectdata(subp.pid, runinfo, fetchenviron)
-                if failed:
-                    if failfast:
-                        logger.error(f"Process returned {failed}. Ending the benchmark")
-                        break
-                    else:
-                        continue
-                runinfos.append(runinfo)
-                if postcommand:
-                    out.write('=' * 39 + " POSTCMD " + '=' * 39 + '\n')
-                    runret = subprocess.run(postcommand, stdout=out, stderr=subprocess.STDOUT)
-                    if postfailfast and runret.returncode:
-                        logger.error(f"Post command returned {runret.returncode}. Ending the benchmark")
-                        break
-        except KeyboardInterrupt as ki:
-            raise ki
-        except Exception:
-            logger.exception("Can't open the process")
-
-    report = process_data(runinfos, envdata[RAWMEM_I], trim, gatherdetails, fetchenviron)
+    spawnmethod = None
+    try:
+        overhead = calibrate_spawn(calibration, **popen_kwargs)
+        for i in range(0, execnum):
+            try:
+                with open(f'{folder_prefix}/{processname}.{start_time.strftime("%y%m%d_%H%M%S")}.{i}.out',
+                          mode='w') as out:
+                    for attempt in range(0, noiseretries + 1):
+                        runinfo = PsRunInfo(i)
+                        runinfo.cache = cache_state(cachemode, i, execnum)
+                        out.seek(0)
+                        out.truncate()
+                        prepare_cache(runinfo.cache, cachefiles, preparecommand, out)
+                        with LaunchedPipeline(stages, out, **popen_kwargs) as subp:
+                            failed = collectdata(subp, runinfo, fetchenviron)
+                        spawnmethod = subp.method
+                        runinfo.minor_faults, runinfo.major_faults = subp.page_faults()
+                        if not failed:
+                            runinfo.totaltime = max(0.0, runinfo.totaltime - overhead)
+                        if failed or noisethreshold is None:
+                            break
+                        noise = runinfo.avg_noise_perc()
+                        if noise is None:
+                            logger.info(f"Run {i} too short to sample the background noise. Not checked")
+                            break
+                        runinfo.noisy = noise > noisethreshold
+                        if not runinfo.noisy:
+                            break
+                        if attempt < noiseretries:
+                            logger.warning(f"Run {i} background noise {noise:.2f}% over {noisethreshold}%. Re-running")
+                        else:
+                            logger.warning(f"Run {i} background noise {noise:.2f}% over {noisethreshold}%. Flagged")
+                    if failed:
+                        if failfast:
+                            logger.error(f"Process returned {failed}. Ending the benchmark")
+                            break
+                        else:
+                            continue
+                    runinfos.append(runinfo)
+                    if postcommand:
+                        out.write('=' * 39 + " POSTCMD " + '=' * 39 + '\n')
+                        out.flush()
+                        runret = subprocess.run(postcommand, stdout=out, stderr=subprocess.STDOUT)
+                        if postfailfast and runret.returncode:
+                            logger.error(f"Post command returned {runret.returncode}. Ending the benchmark")
+                            break
+            except KeyboardInterrupt as ki:
+                raise ki
+            except Exception:
+                logger.exception("Can't open the process")
+    finally:
+        isolation.teardown()
+
+    report = process_data(runinfos, envdata[RAWMEM_I], trim, gatherdetails or timeseries > 0, fetchenviron, timeseries)
+    report.name = testname
+    report.envstats = envdata
+    report.spawn_overhead = Metric(overhead, SECONDS_U)
+    report.spawn_method = spawnmethod
+    report.cache_mode = cachemode
     report_logger(report)
     if json:
         # Actually, do I really need to make an incremental json?
         report_json(report, f'{folder_prefix}/{processname}.{start_time.strftime("%y%m%d_%H%M%S")}.json', testname)
     if xlsx:
         report_xlsx(report, f'{folder_prefix}/{processname}', start_time, testname, extendreport, envdata)
+    return report
@@ -1,7 +1,10 @@
+from collections import namedtuple
 from typing import List
 
 from benchmarkish import *
 
+CpuTimes = namedtuple("CpuTimes", ["user", "system"])
+
 
 def trim_array(arr: List, mean: float) -> List:
     if mean == 0:
@@ -30,10 +33,9 @@ def trim_array(arr: List, mean: float) -> List:
 
 
 class PsRunInfo:
-    environ = {}
-
-    def __init__(self, index: int):
+    def __init__(self, index: int, command=None):
         self.index = index
+        self.command = command
         self.cpu_percent = []
         self.mem_percent = []
         self._trim_cpu_percent = 0
@@ -43,6 +45,15 @@ class PsRunInfo:
         self.last_cpu_times = None
         self.totaltime = None
         self.environ = None
+        self.noise_percent = []
+        self.steal_percent = []
+        self.cpu_freq = []
+        self.noisy = False
+        self.stages = []
+        self.sample_time = []
+        self.cache = None
+        self.minor_faults = None
+        self.major_faults = None
 
     def add_cpu_perc(self, cpuperc):
         self.cpu_percent.append(cpuperc)
@@ -104,7 +115,7 @@ class PsRunInfo:
         return sum(self._trimmed_mem_percent) / len(self._trimmed_mem_percent)
 
     def max_mem_perc(self):
-        return max(self.cpu_percent)
+        return max(self.mem_percent)
 
     def max_trimmed_mem_perc(self, trim: float):
         if trim == 0:
@@ -120,6 +131,28 @@ class PsRunInfo:
         self._trimmed_mem_percent = trim_array(self.mem_percent, trim)
         return max(self._trimmed_mem_percent)
 
-    def merge_environ(self):
-        PsRunInfo.environ.update(self.environ)
-        del self.environ
+    def add_sample_time(self, elapsed):
+        self.sample_time.append(elapsed)
+
+    def add_system_sample(self, noiseperc, stealperc, freq):
+        self.noise_percent.append(noiseperc)
+        self.steal_percent.append(stealperc)
+        if freq is not None:
+            self.cpu_freq.append(freq)
+
+    def avg_noise_perc(self):
+        return sum(self.noise_percent) / len(self.noise_percent) if self.noise_percent else None
+
+    def max_noise_perc(self):
+        return max(self.noise_percent) if self.noise_percent else None
+
+    def avg_steal_perc(self):
+        return sum(self.steal_percent) / len(self.steal_percent) if self.steal_percent else None
+
+    def avg_cpu_freq(self):
+        return sum(self.cpu_freq) / len(self.cpu_freq) if self.cpu_freq else None
+
+    def merge_environ(self, environ: dict):
+        if self.environ:
+            environ.update(self.environ)
+        self.environ = None
@@ -1,16 +1,88 @@
 import statistics
-from collections import OrderedDict, namedtuple
 from typing import List
 
 from benchmarkish import *
 from benchmarkish.model import PsRunInfo
-from benchmarkish.format import get_size
+from benchmarkish.cache import COLD_C, WARM_C
+from benchmarkish.result import BYTES_U, COUNT_U, MHZ_U, PERCENT_U, SECONDS_U, Metric, PhaseResult, RunResult, Series, \
+    StageResult, SuiteResult
+from benchmarkish.timeseries import detect_phases, lttb
 
 
-def process_data(infos: List[PsRunInfo], vmem, trim, is_detailed, is_environ):
-    out = OrderedDict()
-    Detail = namedtuple("Detail", [MEANCPU_I, T_MEANCPU_I, MAXCPU_I, T_MAXCPU_I, MEANMEM_I, T_MEANMEM_I,
-                                   MAXMEM_I, T_MAXMEM_I, CPUTIME_I, SYSCPUTIME_I, TIME_I])
+def process_stage(info: PsRunInfo, membytes) -> StageResult:
+    # A stage can exit before its first sample: only its lifetime is known then
+    sampled = bool(info.cpu_percent)
+    cputimes = info.last_cpu_times
+    return StageResult(
+        info.index, info.command,
+        Metric(info.avg_cpu_perc() if sampled else None, PERCENT_U),
+        Metric(info.max_cpu_perc() if sampled else None, PERCENT_U),
+        Metric(info.avg_mem_perc() * membytes if sampled else None, BYTES_U),
+        Metric(info.max_mem_perc() * membytes if sampled else None, BYTES_U),
+        Metric(cputimes.user if cputimes else None, SECONDS_U),
+        Metric(cputimes.system if cputimes else None, SECONDS_U),
+        Metric(info.totaltime, SECONDS_U)
+    )
+
+
+def process_phases(info: PsRunInfo, membytes) -> List[PhaseResult]:
+    if len(info.sample_time) != len(info.cpu_percent):
+        return []
+    phases = []
+    start = 0
+    for index, end in enumerate(detect_phases([info.cpu_percent, info.mem_percent])):
+        cpu = info.cpu_percent[start:end]
+        mem = info.mem_percent[start:end]
+        phases.append(PhaseResult(
+            index,
+            Metric(info.sample_time[start - 1] if start else 0.0, SECONDS_U),
+            Metric(info.sample_time[end - 1], SECONDS_U),
+            Metric(sum(cpu) / len(cpu), PERCENT_U),
+            Metric(max(cpu), PERCENT_U),
+            Metric(sum(mem) / len(mem) * membytes, BYTES_U),
+            Metric(max(mem) * membytes, BYTES_U)
+        ))
+        start = end
+    return phases
+
+
+def process_series(info: PsRunInfo, membytes, points):
+    if not points or len(info.sample_time) != len(info.cpu_percent):
+        return None, None
+    cpu = Series(PERCENT_U, *lttb(info.sample_time, info.cpu_percent, points))
+    mem = Series(BYTES_U, *lttb(info.sample_time, [m * membytes for m in info.mem_percent], points))
+    return cpu, mem
+
+
+def merge_stages(runs: List[List[StageResult]]) -> List[StageResult]:
+    # Same stage across the runs: every metric is the mean of the runs' values
+    merged = []
+    for stages in zip(*runs):
+        first = stages[0]
+        merged.append(StageResult(first.index, first.command, *(
+            Metric(_mean_or_none([getattr(stage, key).value for stage in stages
+                                  if getattr(stage, key).value is not None]), getattr(first, key).unit)
+            for key in StageResult.__slots__[2:]
+        )))
+    return merged
+
+
+def _mean_or_none(values):
+    return statistics.mean(values) if values else None
+
+
+def _div(total, entries):
+    # No run made it: n/a rather than a crash
+    return total / entries if entries else None
+
+
+def _cache_subset(infos: List[PsRunInfo], state, vmem, trimvalue):
+    subset = [info for info in infos if info.cache == state]
+    return process_data(subset, vmem, trimvalue, False, False, split_cache=False) if subset else None
+
+
+def process_data(infos: List[PsRunInfo], vmem, trimvalue, is_detailed, is_environ, seriespoints=0,
+                 split_cache=True) -> SuiteResult:
     details = []
     entries = 0
     avgcpusum = 0
@@ -25,20 +97,35 @@ def process_data(infos: List[PsRunInfo], vmem, trim, is_detailed, is_environ):
     syscputsum = 0
     timelist = []
     totaltimesum = 0
+    noiselist = []
+    maxnoiselist = []
+    steallist = []
+    freqlist = []
+    noisyruns = 0
+    runstages = []
+    minorfaults = []
+    majorfaults = []
+    environ = {}
+    membytes = vmem / 100
     for info in infos:
         try:
             # Extract
             avgcpu = info.avg_cpu_perc()
-            travgcpu = info.trimmed_avg_cpu_perc(trim)
+            travgcpu = info.trimmed_avg_cpu_perc(trimvalue)
             maxcpu = info.max_cpu_perc()
-            maxtrcpu = info.max_trimmed_cpu_perc(trim)
-            avgmem = info.avg_mem_perc()
-            travgmem = info.trimmed_avg_mem_perc(trim)
-            maxmem = info.max_mem_perc()
-            maxtrmem = info.max_trimmed_mem_perc(trim)
+            maxtrcpu = info.max_trimmed_cpu_perc(trimvalue)
+            avgmem = info.avg_mem_perc() * membytes
+            travgmem = info.trimmed_avg_mem_perc(trimvalue) * membytes
+            maxmem = info.max_mem_perc() * membytes
+            maxtrmem = info.max_trimmed_mem_perc(trimvalue) * membytes
             totaltime = info.totaltime
             usercput = info.last_cpu_times.user
             syscput = info.last_cpu_times.system
+            avgnoise = info.avg_noise_perc()
+            runmaxnoise = info.max_noise_perc()
+            avgsteal = info.avg_steal_perc()
+            avgfreq = info.avg_cpu_freq()
+            stages = [process_stage(stage, membytes) for stage in info.stages] if len(info.stages) > 1 else []
         except KeyboardInterrupt as ki:
             raise ki
         except Exception:
@@ -46,15 +133,22 @@ def process_data(infos: List[PsRunInfo], vmem, trim, is_detailed, is_environ):
             continue
         else:
             # Append
-            details.append(Detail(f"{avgcpu:.2f}%", f"{travgcpu:.2f}%", f"{maxcpu:.2f}%", f"{maxtrcpu:.2f}%",
-                                  get_size(avgmem * (vmem / 100)), get_size(travgmem * (vmem / 100)),
-                                  get_size(maxmem * (vmem / 100)), get_size(maxtrmem * (vmem / 100)),
-                                  usercput, syscput, f"{totaltime:.2f} s"))
+            if is_detailed:
+                cpuseries, memseries = process_series(info, membytes, seriespoints)
+                details.append(RunResult(
+                    info.index, Metric(avgcpu, PERCENT_U), Metric(travgcpu, PERCENT_U), Metric(maxcpu, PERCENT_U),
+                    Metric(maxtrcpu, PERCENT_U), Metric(avgmem, BYTES_U), Metric(travgmem, BYTES_U),
+                    Metric(maxmem, BYTES_U), Metric(maxtrmem, BYTES_U), Metric(usercput, SECONDS_U),
+                    Metric(syscput, SECONDS_U), Metric(totaltime, SECONDS_U), Metric(avgnoise, PERCENT_U),
+                    Metric(runmaxnoise, PERCENT_U), Metric(avgsteal, PERCENT_U), Metric(avgfreq, MHZ_U), info.noisy,
+                    Metric(info.minor_faults, COUNT_U), Metric(info.major_faults, COUNT_U), info.cache, stages,
+                    process_phases(info, membytes), cpuseries, memseries
+                ))
             entries += 1
             avgcpusum += avgcpu
             travgcpusum += travgcpu
             maxcpusum += maxcpu
-            maxtrcpusum +=maxtrcpu
+            maxtrcpusum += maxtrcpu
             avgmemsum += avgmem
             travgmemsum += travgmem
             maxmemsum += maxmem
@@ -63,24 +157,51 @@ def process_data(infos: List[PsRunInfo], vmem, trim, is_detailed, is_environ):
             syscputsum += syscput
             totaltimesum += totaltime
             timelist.append(totaltime)
+            # Runs too short for a system sample have no noise to average
+            if avgnoise is not None:
+                noiselist.append(avgnoise)
+                maxnoiselist.append(runmaxnoise)
+                steallist.append(avgsteal)
+            if avgfreq:
+                freqlist.append(avgfreq)
+            noisyruns += info.noisy
+            if stages:
+                runstages.append(stages)
+            if info.minor_faults is not None:
+                minorfaults.append(info.minor_faults)
+                majorfaults.append(info.major_faults)
             if is_environ:
-                info.merge_environ()
-    out[RUNS_I] = entries
-    out[TRIM_I] = trim
-    out[MEANCPU_I] = f"{(avgcpusum / entries):.2f}%"
-    out[T_MEANCPU_I] = f"{(travgcpusum / entries):.2f}%"
-    out[MAXCPU_I] = f"{(maxcpusum / entries):.2f}%"
-    out[T_MAXCPU_I] = f"{maxtrcpusum / entries}%"
-    out[MEANMEM_I] = get_size((vmem / 100) * (avgmemsum / entries))
-    out[T_MEANMEM_I] = get_size((vmem / 100) * (travgmemsum / entries))
-    out[MAXMEM_I] = get_size((vmem / 100) * (maxmemsum / entries))
-    out[T_MAXMEM_I] = get_size((vmem / 100) * (maxtrmemsum / entries))
-    out[CPUTIME_I] = usercputsum / entries
-    out[SYSCPUTIME_I] = syscputsum / entries
-    out[MEANTIME_I] = f"{(totaltimesum / entries):.2f} s"
-    out[MAXTIME_I] = f"{max(timelist):.2f} s"
-    out[MINTIME_I] = f"{min(timelist):.2f} s"
-    out[MIDTIME_I] = f"{statistics.median(timelist):.2f} s"
-    out[DETAILS_I] = details if is_detailed else []
-    out[PROCENV_I] = PsRunInfo.environ
-    return out
+                info.merge_environ(environ)
+    return SuiteResult(
+        None, entries, trimvalue,
+        Metric(_div(avgcpusum, entries), PERCENT_U),
+        Metric(_div(travgcpusum, entries), PERCENT_U),
+        Metric(_div(maxcpusum, entries), PERCENT_U),
+        Metric(_div(maxtrcpusum, entries), PERCENT_U),
+        Metric(_div(avgmemsum, entries), BYTES_U),
+        Metric(_div(travgmemsum, entries), BYTES_U),
+        Metric(_div(maxmemsum, entries), BYTES_U),
+        Metric(_div(maxtrmemsum, entries), BYTES_U),
+        Metric(_div(usercputsum, entries), SECONDS_U),
+        Metric(_div(syscputsum, entries), SECONDS_U),
+        Metric(_div(totaltimesum, entries), SECONDS_U),
+        Metric(max(timelist) if timelist else None, SECONDS_U),
+        Metric(min(timelist) if timelist else None, SECONDS_U),
+        Metric(statistics.median(timelist) if timelist else None, SECONDS_U),
+        Metric(_mean_or_none(noiselist), PERCENT_U),
+        Metric(max(maxnoiselist) if maxnoiselist else None, PERCENT_U),
+        Metric(_mean_or_none(steallist), PERCENT_U),
+        Metric(statistics.mean(freqlist) if freqlist else None, MHZ_U),
+        noisyruns,
+        Metric(_mean_or_none(minorfaults), COUNT_U),
+        Metric(_mean_or_none(majorfaults), COUNT_U),
+        spawn_overhead=None,
+        spawn_method=None,
+        cache_mode=None,
+        cold=_cache_subset(infos, COLD_C, vmem, trimvalue) if split_cache else None,
+        warm=_cache_subset(infos, WARM_C, vmem, trimvalue) if split_cache else None,
+        stages=merge_stages(runstages) if runstages else [],
+        details=details,
+        environ=environ,
+        envstats=None
+    )
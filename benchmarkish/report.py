@@ -2,38 +2,93 @@ import datetime
 import os
 
 from benchmarkish import *
+from benchmarkish.format import format_metric
+from benchmarkish.result import SuiteResult
 
+SUMMARY_COLUMNS = [
+    (MEANCPU_L, MEANCPU_I), (T_MEANCPU_L, T_MEANCPU_I), (MAXCPU_L, MAXCPU_I), (T_MAXCPU_L, T_MAXCPU_I),
+    (MEANMEM_L, MEANMEM_I), (T_MEANMEM_L, T_MEANMEM_I), (MAXMEM_L, MAXMEM_I), (T_MAXMEM_L, T_MAXMEM_I),
+    (CPUTIME_L, CPUTIME_I), (SYSCPUTIME_L, SYSCPUTIME_I), (MEANTIME_L, MEANTIME_I), (MAXTIME_L, MAXTIME_I),
+    (MINTIME_L, MINTIME_I), (MIDTIME_L, MIDTIME_I), (MEANNOISE_L, MEANNOISE_I), (MAXNOISE_L, MAXNOISE_I),
+    (MEANSTEAL_L, MEANSTEAL_I), (MEANFREQ_L, MEANFREQ_I), (NOISYRUNS_L, NOISYRUNS_I),
+    (SPAWNOVERHEAD_L, SPAWNOVERHEAD_I), (SPAWNMETHOD_L, SPAWNMETHOD_I), (MINORFAULTS_L, MINORFAULTS_I),
+    (MAJORFAULTS_L, MAJORFAULTS_I), (CACHEMODE_L, CACHEMODE_I)
+]
+# What changes between a cold and a warm page cache
+CACHE_COLUMNS = [(RUNS_L, RUNS_I)] + SUMMARY_COLUMNS[:14] + [(MINORFAULTS_L, MINORFAULTS_I),
+                                                            (MAJORFAULTS_L, MAJORFAULTS_I)]
+# Every run field goes under the summary column with the same meaning
+DETAIL_COLUMNS = {
+    MEANCPU_I: MEANCPU_I, T_MEANCPU_I: T_MEANCPU_I, MAXCPU_I: MAXCPU_I, T_MAXCPU_I: T_MAXCPU_I,
+    MEANMEM_I: MEANMEM_I, T_MEANMEM_I: T_MEANMEM_I, MAXMEM_I: MAXMEM_I, T_MAXMEM_I: T_MAXMEM_I,
+    CPUTIME_I: CPUTIME_I, SYSCPUTIME_I: SYSCPUTIME_I, TIME_I: MEANTIME_I, MEANNOISE_I: MEANNOISE_I,
+    MAXNOISE_I: MAXNOISE_I, MEANSTEAL_I: MEANSTEAL_I, MEANFREQ_I: MEANFREQ_I, NOISY_I: NOISYRUNS_I,
+    MINORFAULTS_I: MINORFAULTS_I, MAJORFAULTS_I: MAJORFAULTS_I, CACHE_I: CACHEMODE_I
+}
 
-def report_logger(results: dict):
+STAGE_COLUMNS = [
+    (STAGE_L, STAGE_I), (STAGECMD_L, STAGECMD_I), (MEANCPU_L, MEANCPU_I), (MAXCPU_L, MAXCPU_I),
+    (MEANMEM_L, MEANMEM_I), (MAXMEM_L, MAXMEM_I), (CPUTIME_L, CPUTIME_I), (SYSCPUTIME_L, SYSCPUTIME_I),
+    (LIFETIME_L, LIFETIME_I)
+]
+
+PHASE_COLUMNS = [
+    (PHASE_L, PHASE_I), (START_L, START_I), (END_L, END_I), (MEANCPU_L, MEANCPU_I), (MAXCPU_L, MAXCPU_I),
+    (MEANMEM_L, MEANMEM_I), (MAXMEM_L, MAXMEM_I)
+]
+# Nested per-run results, written in their own blocks
+RUN_BLOCKS = {STAGES_I, PHASES_I, CPUSERIES_I, MEMSERIES_I}
+
+
+def _log_rows(rows, columns, indent=""):
+    for row in rows:
+        logger.info(indent + ", ".join(f"{label}: {_format_field(getattr(row, key))}" for label, key in columns))
+
+
+def report_logger(results: SuiteResult):
     logger.info('=' * 39 + ' RESULTS ' + '=' * 39)
-    logger.info(f"{RUNS_L}: {results[RUNS_I]}")
-    logger.info(f"{TRIM_L}: {results[TRIM_I]}%")
-    logger.info(f"{MEANCPU_L}: {results[MEANCPU_I]}")
-    logger.info(f"{T_MEANCPU_L}: {results[T_MEANCPU_I]}")
-    logger.info(f"{MAXCPU_L}: {results[MAXCPU_I]}")
-    logger.info(f"{T_MAXCPU_L}: {results[T_MAXCPU_I]}")
-    logger.info(f"{MEANMEM_L}: {results[MEANMEM_I]}")
-    logger.info(f"{T_MEANMEM_L}: {results[T_MEANMEM_I]}")
-    logger.info(f"{MAXMEM_L}: {results[MAXMEM_I]}")
-    logger.info(f"{T_MAXMEM_L}: {results[T_MAXMEM_I]}")
-    logger.info(f"{CPUTIME_L}: {results[CPUTIME_I]}")
-    logger.info(f"{SYSCPUTIME_L}: {results[SYSCPUTIME_I]}")
-    logger.info(f"{MEANTIME_L}: {results[MEANTIME_I]}")
-    logger.info(f"{MAXTIME_L}: {results[MAXTIME_I]}")
-    logger.info(f"{MINTIME_L}: {results[MINTIME_I]}")
-    logger.info(f"{MIDTIME_L}: {results[MIDTIME_I]}")
+    logger.info(f"{RUNS_L}: {results.entries}")
+    logger.info(f"{TRIM_L}: {results.trim * 100:g}%")
+    for label, key in SUMMARY_COLUMNS:
+        logger.info(f"{label}: {_format_field(getattr(results, key))}")
+    if results.stages:
+        logger.info('=' * 35 + f' {STAGES_L} ' + '=' * 35)
+        _log_rows(results.stages, STAGE_COLUMNS)
+        bottleneck = max(results.stages, key=lambda s: (s.user_cput.value or 0) + (s.system_cput.value or 0))
+        logger.info(f"Busiest stage: {bottleneck.index} ({bottleneck.command})")
+    if results.cold or results.warm:
+        logger.info('=' * 37 + f' {CACHE_L} ' + '=' * 38)
+        logger.info(f"{'':<16}{COLD_L:>16}{WARM_L:>16}")
+        for label, key in CACHE_COLUMNS:
+            logger.info(f"{label:<16}{_cache_field(results.cold, key):>16}{_cache_field(results.warm, key):>16}")
     logger.info('=' * 39 + ' DETAILS ' + '=' * 39)
-    logger.info(f"{results[DETAILS_I]}")
-    logger.info(f"{results[PROCENV_I]}")
+    for run in results.details:
+        logger.info(", ".join(f"{key}={_format_field(getattr(run, key))}" for key in run.__slots__
+                              if key not in RUN_BLOCKS))
+        _log_rows(run.stages, STAGE_COLUMNS, "    ")
+        if len(run.phases) > 1:
+            _log_rows(run.phases, PHASE_COLUMNS, "    ")
+    logger.info(f"{results.environ}")
+
 
+def _format_field(value):
+    if value is None:
+        return "n/a"
+    return value if isinstance(value, (bool, int, str)) else format_metric(value)
 
-def report_json(results: dict, fpname: str, tname: str):
+
+def _cache_field(results, key):
+    return "n/a" if results is None else _format_field(getattr(results, key))
+
+
+def report_json(results: SuiteResult, fpname: str, tname: str):
     import json
     with open(fpname, mode='w') as t:
-        json.dump({tname: results}, t)
+        json.dump({tname: results.to_dict()}, t)
 
 
-def report_xlsx(results: dict, fprefix: str, starttime: datetime.datetime, tname: str, append: bool, envdata: dict):
+def report_xlsx(results: SuiteResult, fprefix: str, starttime: datetime.datetime, tname: str, append: bool,
+                envdata: dict):
     from openpyxl import Workbook, load_workbook
     from openpyxl.styles import Font
 
@@ -55,65 +110,77 @@ def report_xlsx(results: dict, fprefix: str, starttime: datetime.datetime, tname
 
     cell = ws.cell(1, 1, RUNS_L)
     cell.font = boldfont
-    _ = ws.cell(2, 1, results[RUNS_I])
+    _ = ws.cell(2, 1, results.entries)
     cell = ws.cell(1, 2, TRIM_L)
     cell.font = boldfont
-    _ = ws.cell(2, 2, (results[TRIM_I] * 100))
-    cell = ws.cell(1, 3, MEANCPU_L)
-    cell.font = boldfont
-    _ = ws.cell(2, 3, results[MEANCPU_I])
-    cell = ws.cell(1, 4, T_MEANCPU_L)
-    cell.font = boldfont
-    _ = ws.cell(2, 4, results[T_MEANCPU_I])
-    cell = ws.cell(1, 5, MAXCPU_L)
-    cell.font = boldfont
-    _ = ws.cell(2, 5, results[MAXCPU_I])
-    cell = ws.cell(1, 6, T_MAXCPU_L)
-    cell.font = boldfont
-    _ = ws.cell(2, 6, results[T_MAXCPU_I])
-    cell = ws.cell(1, 7, MEANMEM_L)
-    cell.font = boldfont
-    _ = ws.cell(2, 7, results[MEANMEM_I])
-    cell = ws.cell(1, 8, T_MEANMEM_L)
-    cell.font = boldfont
-    _ = ws.cell(2, 8, results[T_MEANMEM_I])
-    cell = ws.cell(1, 9, MAXMEM_L)
-    cell.font = boldfont
-    _ = ws.cell(2, 9, results[MAXMEM_I])
-    cell = ws.cell(1, 10, T_MAXMEM_L)
-    cell.font = boldfont
-    _ = ws.cell(2, 10, results[T_MAXMEM_I])
-    cell = ws.cell(1, 11, CPUTIME_L)
-    cell.font = boldfont
-    _ = ws.cell(2, 11, results[CPUTIME_I])
-    cell = ws.cell(1, 12, SYSCPUTIME_L)
-    cell.font = boldfont
-    _ = ws.cell(2, 12, results[SYSCPUTIME_I])
-    cell = ws.cell(1, 13, MEANTIME_L)
-    cell.font = boldfont
-    _ = ws.cell(2, 13, results[MEANTIME_I])
-    cell = ws.cell(1, 14, MAXTIME_L)
-    cell.font = boldfont
-    _ = ws.cell(2, 14, results[MAXTIME_I])
-    cell = ws.cell(1, 15, MINTIME_L)
-    cell.font = boldfont
-    _ = ws.cell(2, 15, results[MINTIME_I])
-    cell = ws.cell(1, 16, MIDTIME_L)
-    cell.font = boldfont
-    _ = ws.cell(2, 16, results[MIDTIME_I])
+    _ = ws.cell(2, 2, (results.trim * 100))
+    columns = {}
+    colnum = 3
+    for label, key in SUMMARY_COLUMNS:
+        cell = ws.cell(1, colnum, label)
+        cell.font = boldfont
+        _ = ws.cell(2, colnum, _format_field(getattr(results, key)))
+        columns[key] = colnum
+        colnum += 1
+    lastcol = colnum - 1
 
     rownum = 4
-    colnum = 3
-    for detail in results[DETAILS_I]:
-        _ = ws.cell(rownum, 1, rownum - 3)
-        for value in detail:
-            _ = ws.cell(rownum, colnum, value)
-            colnum += 1
+    for run in results.details:
+        _ = ws.cell(rownum, 1, run.index + 1)
+        for key, column in DETAIL_COLUMNS.items():
+            _ = ws.cell(rownum, columns[column], _format_field(getattr(run, key)))
+        rownum += 1
+
+    if results.stages:
+        rownum += 1
+        cell = ws.cell(rownum, 1, STAGES_L)
+        cell.font = boldfont
+        rownum += 1
+        for colnum, (label, _) in enumerate(STAGE_COLUMNS, start=1):
+            cell = ws.cell(rownum, colnum, label)
+            cell.font = boldfont
+        rownum += 1
+        for stage in results.stages:
+            for colnum, (_, key) in enumerate(STAGE_COLUMNS, start=1):
+                _ = ws.cell(rownum, colnum, _format_field(getattr(stage, key)))
+            rownum += 1
+
+    phases = [(run.index + 1, phase) for run in results.details for phase in run.phases]
+    if phases:
         rownum += 1
-        colnum = 3
+        cell = ws.cell(rownum, 1, PHASES_L)
+        cell.font = boldfont
+        rownum += 1
+        for colnum, label in enumerate([RUN_L] + [label for label, _ in PHASE_COLUMNS], start=1):
+            cell = ws.cell(rownum, colnum, label)
+            cell.font = boldfont
+        rownum += 1
+        for runnum, phase in phases:
+            _ = ws.cell(rownum, 1, runnum)
+            for colnum, (_, key) in enumerate(PHASE_COLUMNS, start=2):
+                _ = ws.cell(rownum, colnum, _format_field(getattr(phase, key)))
+            rownum += 1
+
+    if results.cold or results.warm:
+        rownum += 1
+        cell = ws.cell(rownum, 1, CACHE_L)
+        cell.font = boldfont
+        for colnum, label in ((2, COLD_L), (3, WARM_L)):
+            cell = ws.cell(rownum, colnum, label)
+            cell.font = boldfont
+        rownum += 1
+        for label, key in CACHE_COLUMNS:
+            cell = ws.cell(rownum, 1, label)
+            cell.font = boldfont
+            _ = ws.cell(rownum, 2, _cache_field(results.cold, key))
+            _ = ws.cell(rownum, 3, _cache_field(results.warm, key))
+            rownum += 1
+
+    if any(run.cpu_series for run in results.details):
+        _series_sheet(wb, f"{tname[:24]}_series", results, boldfont)
 
     rownum = 1
-    colnum = 18
+    colnum = lastcol + 2
     cell = ws.cell(rownum, colnum, ENV_L)
     cell.font = boldfont
     rownum += 1
@@ -122,14 +189,34 @@ def report_xlsx(results: dict, fprefix: str, starttime: datetime.datetime, tname
         cell.font = boldfont
         _ = ws.cell(rownum, colnum + 1, str(value))
         rownum += 1
-        pass
     rownum += 1
     cell = ws.cell(rownum, colnum, PROCENV_L)
     cell.font = boldfont
     rownum += 1
-    for key, value in results[PROCENV_I].items():
+    for key, value in results.environ.items():
         cell = ws.cell(rownum, colnum, key)
         cell.font = boldfont
         _ = ws.cell(rownum, colnum + 1, str(value))
+        rownum += 1
 
     wb.save(fname)
+
+
+def _series_sheet(wb, title, results: SuiteResult, boldfont):
+    # Raw numbers here, they're meant for charts. Every run takes four columns: time/cpu and time/memory
+    ws = wb.create_sheet(title)
+    colnum = 1
+    for run in results.details:
+        for label, series in ((CPUSERIES_L, run.cpu_series), (MEMSERIES_L, run.mem_series)):
+            if not series:
+                continue
+            cell = ws.cell(1, colnum, f"{RUN_L} {run.index + 1}")
+            cell.font = boldfont
+            cell = ws.cell(2, colnum, f"{SERIESTIME_L} (s)")
+            cell.font = boldfont
+            cell = ws.cell(2, colnum + 1, f"{label} ({series.unit})")
+            cell.font = boldfont
+            for rownum, (x, y) in enumerate(zip(series.time, series.values), start=3):
+                _ = ws.cell(rownum, colnum, x)
+                _ = ws.cell(rownum, colnum + 1, y)
+            colnum += 2
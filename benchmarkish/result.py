@@ -0,0 +1,150 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+PERCENT_U = "%"
+BYTES_U = "B"
+SECONDS_U = "s"
+MHZ_U = "MHz"
+COUNT_U = "count"
+
+
+def _serialize(value):
+    if hasattr(value, "to_dict"):
+        return value.to_dict()
+    if isinstance(value, list):
+        return [_serialize(v) for v in value]
+    return value
+
+
+@dataclass
+class Metric:
+    __slots__ = ("value", "unit")
+    value: Optional[float]
+    unit: str
+
+    def to_dict(self):
+        return {"value": self.value, "unit": self.unit}
+
+
+@dataclass
+class Series:
+    __slots__ = ("unit", "time", "values")
+    unit: str
+    time: List[float]
+    values: List[float]
+
+    def to_dict(self):
+        return {"unit": self.unit, "time": self.time, "values": self.values}
+
+
+@dataclass
+class PhaseResult:
+    __slots__ = ("index", "start", "end", "avg_cpu", "max_cpu", "avg_mem", "max_mem")
+    index: int
+    start: Metric
+    end: Metric
+    avg_cpu: Metric
+    max_cpu: Metric
+    avg_mem: Metric
+    max_mem: Metric
+
+    def to_dict(self):
+        return {k: _serialize(getattr(self, k)) for k in self.__slots__}
+
+
+@dataclass
+class StageResult:
+    __slots__ = ("index", "command", "avg_cpu", "max_cpu", "avg_mem", "max_mem", "user_cput", "system_cput",
+                 "lifetime")
+    index: int
+    command: str
+    avg_cpu: Metric
+    max_cpu: Metric
+    avg_mem: Metric
+    max_mem: Metric
+    user_cput: Metric
+    system_cput: Metric
+    lifetime: Metric
+
+    def to_dict(self):
+        return {k: _serialize(getattr(self, k)) for k in self.__slots__}
+
+
+@dataclass
+class RunResult:
+    __slots__ = ("index", "avg_cpu", "trimmed_avg_cpu", "max_cpu", "max_trimmed_cpu", "avg_mem", "trimmed_avg_mem",
+                 "max_mem", "max_trimmed_mem", "user_cput", "system_cput", "time", "avg_noise", "max_noise",
+                 "avg_steal", "avg_freq", "noisy", "minor_faults", "major_faults", "cache", "stages", "phases",
+                 "cpu_series", "mem_series")
+    index: int
+    avg_cpu: Metric
+    trimmed_avg_cpu: Metric
+    max_cpu: Metric
+    max_trimmed_cpu: Metric
+    avg_mem: Metric
+    trimmed_avg_mem: Metric
+    max_mem: Metric
+    max_trimmed_mem: Metric
+    user_cput: Metric
+    system_cput: Metric
+    time: Metric
+    avg_noise: Metric
+    max_noise: Metric
+    avg_steal: Metric
+    avg_freq: Metric
+    noisy: bool
+    minor_faults: Metric
+    major_faults: Metric
+    cache: Optional[str]
+    stages: List[StageResult]
+    phases: List[PhaseResult]
+    cpu_series: Optional[Series]
+    mem_series: Optional[Series]
+
+    def to_dict(self):
+        return {k: _serialize(getattr(self, k)) for k in self.__slots__}
+
+
+@dataclass
+class SuiteResult:
+    __slots__ = ("name", "entries", "trim", "avg_cpu", "trimmed_avg_cpu", "max_cpu", "max_trimmed_cpu", "avg_mem",
+                 "trimmed_avg_mem", "max_mem", "max_trimmed_mem", "user_cput", "system_cput", "total_time",
+                 "max_time", "min_time", "mid_time", "avg_noise", "max_noise", "avg_steal", "avg_freq", "noisy_runs",
+                 "minor_faults", "major_faults", "spawn_overhead", "spawn_method", "cache_mode", "cold", "warm",
+                 "stages", "details", "environ", "envstats")
+    name: Optional[str]
+    entries: int
+    trim: float
+    avg_cpu: Metric
+    trimmed_avg_cpu: Metric
+    max_cpu: Metric
+    max_trimmed_cpu: Metric
+    avg_mem: Metric
+    trimmed_avg_mem: Metric
+    max_mem: Metric
+    max_trimmed_mem: Metric
+    user_cput: Metric
+    system_cput: Metric
+    total_time: Metric
+    max_time: Metric
+    min_time: Metric
+    mid_time: Metric
+    avg_noise: Metric
+    max_noise: Metric
+    avg_steal: Metric
+    avg_freq: Metric
+    noisy_runs: int
+    minor_faults: Metric
+    major_faults: Metric
+    spawn_overhead: Optional[Metric]
+    spawn_method: Optional[str]
+    cache_mode: Optional[str]
+    cold: Optional["SuiteResult"]
+    warm: Optional["SuiteResult"]
+    stages: List[StageResult]
+    details: List[RunResult]
+    environ: Dict[str, str]
+    envstats: Optional[Dict]
+
+    def to_dict(self):
+        return {k: _serialize(getattr(self, k)) for k in self.__slots__}
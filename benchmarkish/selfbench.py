@@ -0,0 +1,417 @@
+import argparse
+import datetime
+import gc
+import itertools
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import psutil
+
+from benchmarkish import *
+from benchmarkish.launcher import LaunchedPipeline, calibrate_spawn
+from benchmarkish.main import collectdata
+from benchmarkish.model import CpuTimes, PsRunInfo, trim_array
+from benchmarkish.processor import process_data
+from benchmarkish.report import report_json, report_logger, report_xlsx
+from benchmarkish.timeseries import detect_phases, lttb
+
+MB = 1024 * 1024
+TRIM = 0.1
+REPEAT = 3
+# Seconds of calls a timing gets at least, and how many calls at most to get there
+TIMING_BUDGET = 1.0
+MAX_CALLS = 50
+REFERENCE_LOOP = 200000
+REFERENCE_CALLS = 10
+
+# Synthetic workloads with a known profile. Each one is a python one-liner, so they run anywhere benchmarkish does
+CPU_BURN = "import time\nend = time.perf_counter() + {seconds}\nwhile time.perf_counter() < end: pass"
+MEM_HOLD = "import time\nb = b'x' * {nbytes}\ntime.sleep({seconds})"
+SLEEP = "import time\ntime.sleep({seconds})"
+
+
+def _python(code):
+    return [sys.executable, "-c", code]
+
+
+def _sleeper(seconds):
+    # The interpreter startup would be most of the CPU a sleeping python uses, the sleep executable has next to none
+    sleep = shutil.which('sleep')
+    return [sleep, str(seconds)] if sleep else _python(SLEEP.format(seconds=seconds))
+
+
+def _watch(command, runs, overhead, vmem):
+    infos = []
+    with open(os.devnull, mode='w') as out:
+        for i in range(0, runs):
+            info = PsRunInfo(i)
+            with LaunchedPipeline([command], out) as proc:
+                collectdata(proc, info)
+            info.totaltime = max(0.0, info.totaltime - overhead)
+            infos.append(info)
+    return infos, process_data(infos, vmem, 0, False, False, split_cache=False)
+
+
+def _check(name, measured, low, high):
+    ok = low <= measured <= high
+    logger.info(f"{'OK  ' if ok else 'FAIL'} {name}: {measured:.4f} (expected {low:.4f} .. {high:.4f})")
+    return {"name": name, "measured": measured, "low": low, "high": high, "ok": ok}
+
+
+def check_accuracy(runs):
+    # Measured values against what the workloads are known to do. Tolerances cover the 0.2 s sampling and the
+    # interpreter startup, not a sampler that drifts
+    vmem = psutil.virtual_memory().total
+    overhead = calibrate_spawn(10)
+    checks = []
+
+    _, result = _watch(_python(CPU_BURN.format(seconds=1.5)), runs, overhead, vmem)
+    checks.append(_check("cpu_burn.time", result.mid_time.value, 1.5, 1.5 + 0.3))
+    checks.append(_check("cpu_burn.cput", result.user_cput.value + result.system_cput.value, 1.5 * 0.85, 1.8))
+    checks.append(_check("cpu_burn.avg_cpu", result.avg_cpu.value, 80.0, 110.0))
+
+    _, result = _watch(_python(MEM_HOLD.format(nbytes=200 * MB, seconds=1.0)), runs, overhead, vmem)
+    checks.append(_check("mem_hold.max_mem", result.max_mem.value / MB, 200.0, 200.0 + 64.0))
+
+    sleeper = _sleeper(1.0)
+    _, result = _watch(sleeper, runs, overhead, vmem)
+    checks.append(_check("sleep.time", result.mid_time.value, 1.0, 1.0 + 0.15))
+    if sleeper[0] != sys.executable:
+        checks.append(_check("sleep.avg_cpu", result.avg_cpu.value, 0.0, 5.0))
+    else:
+        logger.warning("No sleep executable here, sleep.avg_cpu not checked")
+
+    _, result = _watch(_sleeper(0.05), runs, overhead, vmem)
+    checks.append(_check("short_sleep.time", result.mid_time.value, 0.05, 0.05 + 0.1))
+    return checks
+
+
+def known_infos(runs, samples):
+    # Every run samples 1..samples in a shuffled order, shifted by an offset: means, maxes and trimmed values are known
+    # in closed form, see check_aggregation
+    rnd = random.Random(0)
+    base = list(range(1, samples + 1))
+    rnd.shuffle(base)
+    infos = []
+    for r in range(0, runs):
+        offset = r % 10
+        info = PsRunInfo(r)
+        info.cpu_percent = [v + offset for v in base]
+        info.mem_percent = [(v + offset) / 100 for v in base]
+        info.noise_percent = [offset] * samples
+        info.steal_percent = [0.0] * samples
+        info.cpu_freq = [2000.0] * samples
+        info.sample_time = [(i + 1) * 0.2 for i in range(0, samples)]
+        info.last_cpu_times = CpuTimes(1.0 + offset, 0.5)
+        info.totaltime = 10.0 + offset
+        info.minor_faults = 100 * offset
+        info.major_faults = offset
+        infos.append(info)
+    return infos
+
+
+def _close(name, measured, expected):
+    slack = abs(expected) * 1e-9 + 1e-9
+    return _check(name, measured, expected - slack, expected + slack)
+
+
+def check_aggregation(runs, samples, trim, outdir):
+    # PsRunInfo reductions, trim_array, process_data and the json writer against values computed by hand
+    vmem = 100 * MB
+    membytes = vmem / 100
+    offsets = [r % 10 for r in range(0, runs)]
+    offset = statistics.mean(offsets)
+    # trim_array drops int(samples * 2 * trim) values, half from each end. An odd one out merges the extremes left,
+    # which keeps the mean and takes one more from the top
+    dropped = int(samples * 2 * trim)
+    trimmed_max = samples - dropped // 2 - dropped % 2
+    expected = {
+        "avg_cpu": (samples + 1) / 2 + offset,
+        "trimmed_avg_cpu": (samples + 1) / 2 + offset,
+        "max_cpu": samples + offset,
+        "max_trimmed_cpu": trimmed_max + offset,
+        "avg_mem": ((samples + 1) / 2 + offset) / 100 * membytes,
+        "trimmed_avg_mem": ((samples + 1) / 2 + offset) / 100 * membytes,
+        "max_mem": (samples + offset) / 100 * membytes,
+        "max_trimmed_mem": (trimmed_max + offset) / 100 * membytes,
+        "user_cput": 1.0 + offset,
+        "system_cput": 0.5,
+        "total_time": 10.0 + offset,
+        "max_time": 10.0 + max(offsets),
+        "min_time": 10.0 + min(offsets),
+        "mid_time": 10.0 + statistics.median(offsets),
+        "avg_noise": offset,
+        "max_noise": max(offsets),
+        "minor_faults": 100 * offset,
+        "major_faults": offset,
+    }
+    checks = []
+    result = process_data(known_infos(runs, samples), vmem, trim, True, False)
+    for key, value in expected.items():
+        checks.append(_close(f"aggregation.{key}", getattr(result, key).value, value))
+    last = result.details[-1]
+    checks.append(_close("aggregation.run.avg_cpu", last.avg_cpu.value, (samples + 1) / 2 + offsets[-1]))
+    checks.append(_close("aggregation.run.max_trimmed_cpu", last.max_trimmed_cpu.value, trimmed_max + offsets[-1]))
+
+    result.name = "selfbench"
+    result.envstats = {}
+    fname = os.path.join(outdir, "aggregation.json")
+    report_json(result, fname, "selfbench")
+    with open(fname) as f:
+        loaded = json.load(f)["selfbench"]
+    checks.append(_check("aggregation.json_roundtrip", float(loaded == result.to_dict()), 1.0, 1.0))
+    return checks
+
+
+def measure_sampler(seconds):
+    # CPU time benchmarkish itself spends for every sampler tick, while a process sleeps
+    info = PsRunInfo(0)
+    with open(os.devnull, mode='w') as out:
+        before = time.process_time()
+        with LaunchedPipeline([_sleeper(seconds)], out) as proc:
+            collectdata(proc, info)
+        spent = time.process_time() - before
+    return spent / max(1, len(info.cpu_percent))
+
+
+def synthetic_infos(runs, samples, seed=0):
+    # Realistic shapes without the collection: a busy startup, then a memory ramp with noise
+    rnd = random.Random(seed)
+    startup = max(1, samples // 10)
+    cpu = [rnd.gauss(95, 3) if i % samples < startup else rnd.gauss(20, 5) for i in range(0, samples * 2)]
+    mem = [0.5 + (i % samples) * 0.01 + rnd.random() * 0.05 for i in range(0, samples * 2)]
+    noise = [rnd.random() * 5 for _ in range(0, samples * 2)]
+    times = [(i + 1) * 0.2 for i in range(0, samples)]
+    infos = []
+    for r in range(0, runs):
+        offset = r % samples
+        info = PsRunInfo(r)
+        info.cpu_percent = cpu[offset:offset + samples]
+        info.mem_percent = mem[offset:offset + samples]
+        info.noise_percent = noise[offset:offset + samples]
+        info.steal_percent = noise[offset:offset + samples]
+        info.cpu_freq = [2000.0] * samples
+        info.sample_time = list(times)
+        info.last_cpu_times = CpuTimes(samples * 0.1, samples * 0.01)
+        info.totaltime = samples * 0.2
+        info.minor_faults = 1000 + r
+        info.major_faults = r % 3
+        infos.append(info)
+    return infos
+
+
+def _reference():
+    # A fixed pure python loop, timed next to every path. Comparing against it cancels out how fast the machine
+    # happens to be (frequency, steal, a busy neighbour) when each timing is taken
+    samples = []
+    gc.disable()
+    try:
+        for _ in range(0, REFERENCE_CALLS):
+            start = time.perf_counter()
+            total = 0
+            for i in range(0, REFERENCE_LOOP):
+                total += i * i
+            samples.append(time.perf_counter() - start)
+    finally:
+        gc.enable()
+    return min(samples)
+
+
+def _timed(timings, name, func, setup=None, repeat=REPEAT, references=None):
+    # A discarded warm-up call, then the fastest of at least repeat calls: the one least disturbed by the rest of the
+    # machine. Fast paths are called until TIMING_BUDGET is spent, so a single hiccup can't be the best of few.
+    # setup() builds fresh arguments outside of the timing, for the paths that cache on their inputs. The collector
+    # is off while timing, as timeit does
+    samples = []
+    out = None
+    calls = 0
+    while calls <= repeat or (sum(samples) < TIMING_BUDGET and calls <= MAX_CALLS):
+        args = setup() if setup else ()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            out = func(*args)
+            elapsed = time.perf_counter() - start
+        finally:
+            gc.enable()
+        if calls:
+            samples.append(elapsed)
+        calls += 1
+    timings[name] = min(samples)
+    if references is not None:
+        references[name] = _reference()
+    logger.info(f"{name}: {timings[name] * 1000:.2f} ms (median {statistics.median(samples) * 1000:.2f} ms "
+                f"of {len(samples)})")
+    return out
+
+
+def measure_scale(runs, samples, trim, points, outdir, repeat=REPEAT):
+    timings = {}
+    references = {}
+    vmem = psutil.virtual_memory().total
+    logger.info(f"Scale: {runs} runs of {samples} samples, {runs * samples} samples per series, "
+                f"best of {repeat} or more")
+
+    series = synthetic_infos(1, runs * samples)[0]
+    _timed(timings, "trim_array", trim_array, lambda: (series.cpu_percent, trim), repeat, references)
+    _timed(timings, "lttb", lttb, lambda: (series.sample_time, series.cpu_percent, points), repeat, references)
+    del series
+
+    infos = synthetic_infos(runs, samples)
+
+    def phases():
+        # As process_data_detailed runs it: every run on its own, all of the samples
+        for info in infos:
+            detect_phases([info.cpu_percent, info.mem_percent])
+
+    _timed(timings, "detect_phases", phases, None, repeat, references)
+    del infos
+
+    def reductions(infos):
+        for info in infos:
+            info.avg_cpu_perc()
+            info.trimmed_avg_cpu_perc(trim)
+            info.max_trimmed_cpu_perc(trim)
+            info.avg_mem_perc()
+            info.trimmed_avg_mem_perc(trim)
+            info.max_trimmed_mem_perc(trim)
+
+    # The trimmed values are cached on the infos, every call gets new ones
+    _timed(timings, "reductions", reductions, lambda: (synthetic_infos(runs, samples),), repeat, references)
+    _timed(timings, "process_data", process_data, lambda: (synthetic_infos(runs, samples), vmem, trim, False, False),
+           repeat, references)
+    result = _timed(timings, "process_data_detailed", process_data,
+                    lambda: (synthetic_infos(runs, samples), vmem, trim, True, False, points), repeat, references)
+    result.name = "selfbench"
+    result.envstats = {}
+
+    def quiet_report_logger(result):
+        # Formatting is what is measured here, not the console
+        level = logger.level
+        logger.setLevel(logging.WARNING)
+        try:
+            report_logger(result)
+        finally:
+            logger.setLevel(level)
+
+    _timed(timings, "report_logger", quiet_report_logger, lambda: (result,), repeat, references)
+    _timed(timings, "report_json", report_json,
+           lambda: (result, os.path.join(outdir, "selfbench.json"), "selfbench"), repeat, references)
+    try:
+        import openpyxl
+    except ImportError:
+        logger.warning("openpyxl isn't installed, report_xlsx not measured")
+    else:
+        # A new file every time: an existing one would be loaded and appended to
+        prefixes = (os.path.join(outdir, f"selfbench{i}") for i in itertools.count())
+        _timed(timings, "report_xlsx", report_xlsx,
+               lambda: (result, next(prefixes), datetime.datetime.today(), "selfbench", False, {}), repeat, references)
+    return timings, references
+
+
+def compare(results, baseline, tolerance):
+    # Timings taken on a machine running slower than at baseline time are scaled back by the reference loop. Its
+    # fastest time over the whole run: a single one is as noisy as the timings it should correct
+    if any(results["scale"].get(k) != baseline.get("scale", {}).get(k) for k in ("runs", "samples", "points")):
+        logger.warning(f"The baseline was taken at another scale ({baseline.get('scale')}). Timings not compared")
+        return []
+    ref = min(results.get("references", {}).values(), default=None)
+    oldref = min(baseline.get("references", {}).values(), default=None)
+    speed = ref / oldref if ref and oldref else 1.0
+    logger.info(f"Machine speed against the baseline: x{1 / speed:.2f}")
+    regressions = []
+    for name, value in results["timings"].items():
+        old = baseline.get("timings", {}).get(name)
+        if not old:
+            continue
+        ratio = value / (old * speed)
+        slower = ratio > 1 + tolerance / 100
+        logger.info(f"{'SLOWER' if slower else 'ok    '} {name}: {old * 1000:.2f} ms -> {value * 1000:.2f} ms "
+                    f"({(ratio - 1) * 100:+.1f}%)")
+        if slower:
+            regressions.append(name)
+    return regressions
+
+
+def resolve_args():
+    p = argparse.ArgumentParser(description="Benchmarks benchmarkish itself: checks the collected values against "
+                                            "workloads with a known profile and times the aggregation and report "
+                                            "paths at scale. Results are saved as json, to be compared with a later "
+                                            "run")
+    p.add_argument('--runs', type=int, default=1000,
+                   help="Number of synthetic runs fed to the aggregation and report paths")
+    p.add_argument('--samples', type=int, default=1000,
+                   help="Number of samples of every synthetic run")
+    p.add_argument('--points', type=int, default=200,
+                   help="Points kept by the time series downsampling")
+    p.add_argument('--accuracyruns', type=int, default=3,
+                   help="How many times every known workload is executed. The runs are aggregated as in a report, "
+                        "the median time and the mean of everything else are checked")
+    p.add_argument('--noaccuracy', default=False, action='store_true',
+                   help="Skips the checks against the known workloads and the known aggregation values")
+    p.add_argument('--repeat', type=int, default=REPEAT,
+                   help="How many times every path is timed at least, after a warm-up call. The fastest one is kept")
+    p.add_argument('--noscale', default=False, action='store_true',
+                   help="Skips the timings at scale")
+    p.add_argument('--output', '-o', type=str,
+                   help="Where the results json is saved. Defaults to selfbench.<timestamp>.json")
+    p.add_argument('--baseline', '-b', type=str,
+                   help="A previous results json. Timings slower than --tolerance make the run fail")
+    p.add_argument('--tolerance', type=float, default=20,
+                   help="Percentage a timing can grow over the baseline before it's a regression")
+    return vars(p.parse_args())
+
+
+def main():
+    argv = resolve_args()
+    results = {}
+    results["timestamp"] = datetime.datetime.today().isoformat()
+    results["python"] = platform.python_version()
+    results["platform"] = platform.platform()
+    results["scale"] = {"runs": argv['runs'], "samples": argv['samples'], "points": argv['points'],
+                        "repeat": argv['repeat']}
+    results["accuracy"] = []
+    results["timings"] = {}
+    results["references"] = {}
+    with tempfile.TemporaryDirectory() as outdir:
+        if not argv['noaccuracy']:
+            results["accuracy"] = check_accuracy(argv['accuracyruns'])
+            results["accuracy"] += check_aggregation(argv['runs'], argv['samples'], TRIM, outdir)
+            ticks = [measure_sampler(1.0) for _ in range(0, argv['repeat'])]
+            results["timings"]["sampler_tick"] = min(ticks)
+            results["references"]["sampler_tick"] = _reference()
+            logger.info(f"sampler_tick: {min(ticks) * 1000:.3f} ms of CPU "
+                        f"(median {statistics.median(ticks) * 1000:.3f} ms of {argv['repeat']})")
+        if not argv['noscale']:
+            timings, references = measure_scale(argv['runs'], argv['samples'], TRIM, argv['points'], outdir,
+                                                argv['repeat'])
+            results["timings"].update(timings)
+            results["references"].update(references)
+
+    fname = argv['output'] or f"selfbench.{datetime.datetime.today().strftime('%y%m%d_%H%M%S')}.json"
+    with open(fname, mode='w') as f:
+        json.dump(results, f, indent=2)
+    logger.info(f"Results saved in {fname}")
+
+    failed = [check["name"] for check in results["accuracy"] if not check["ok"]]
+    if failed:
+        logger.error(f"Accuracy checks failed: {', '.join(failed)}")
+    regressions = []
+    if argv['baseline']:
+        with open(argv['baseline']) as f:
+            regressions = compare(results, json.load(f), argv['tolerance'])
+        if regressions:
+            logger.error(f"Slower than the baseline: {', '.join(regressions)}")
+    sys.exit(1 if failed or regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,224 @@
+import glob
+import os
+import sys
+
+import psutil
+
+if sys.platform != 'win32':
+    import resource
+
+from benchmarkish import *
+
+CPUFREQ_ROOT = "/sys/devices/system/cpu"
+CGROUP_ROOT = "/sys/fs/cgroup"
+CGROUP_PERIOD = 100000
+# cpu_times_percent counts in scheduler ticks (10 ms on most kernels): over a shorter window it can only say 0% or 100%
+SYSTEM_SAMPLE_WINDOW = 0.05
+
+
+def prime_system_sampler():
+    # cpu_times_percent(None) compares against the previous call, so the first one is meaningless
+    psutil.cpu_times_percent()
+
+
+def sample_system():
+    # busy%, steal% since the previous call and the current frequency in MHz (None if unknown)
+    times = psutil.cpu_times_percent()._asdict()
+    # guest time is already accounted in user/nice. The rest doesn't always add up to 100 (coarse ticks on VMs)
+    total = sum(v for k, v in times.items() if k not in ('guest', 'guest_nice'))
+    if total:
+        busy = 100.0 * (total - times['idle'] - times.get('iowait', 0.0)) / total
+        steal = 100.0 * times.get('steal', 0.0) / total
+    else:
+        busy = steal = 0.0
+    try:
+        freq = psutil.cpu_freq()
+    except Exception:
+        freq = None
+    return busy, steal, freq.current if freq else None
+
+
+def _read_first_line(path):
+    try:
+        with open(path) as f:
+            return f.readline().strip()
+    except OSError:
+        return None
+
+
+def _write(path, value):
+    with open(path, 'w') as f:
+        f.write(value)
+
+
+def _cgroup2_root():
+    # /sys/fs/cgroup on unified hierarchies, somewhere else (often /sys/fs/cgroup/unified) on hybrid ones
+    try:
+        with open("/proc/mounts") as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) > 2 and fields[2] == "cgroup2":
+                    return fields[1]
+    except OSError:
+        pass
+    return CGROUP_ROOT if os.path.exists(f"{CGROUP_ROOT}/cgroup.controllers") else None
+
+
+def _own_cgroup():
+    # The cgroup v2 entry is "0::<path>", on hybrid systems it isn't the first line
+    try:
+        with open("/proc/self/cgroup") as f:
+            for line in f:
+                if line.startswith("0::"):
+                    return line.strip()[3:]
+    except OSError:
+        pass
+    return "/"
+
+
+def check_cpu_scaling():
+    # Pre-flight check: anything here that isn't pinned will make the timings drift
+    out = {}
+    governors = {_read_first_line(p) for p in glob.glob(f"{CPUFREQ_ROOT}/cpu[0-9]*/cpufreq/scaling_governor")}
+    governors.discard(None)
+    out[CPUGOVERNOR_I] = ",".join(sorted(governors)) if governors else "n/a"
+    if governors and governors != {"performance"}:
+        logger.warning(f"CPU governor is '{out[CPUGOVERNOR_I]}'. Consider 'performance' for stable timings")
+
+    boost = _read_first_line(f"{CPUFREQ_ROOT}/cpufreq/boost")
+    if boost is not None:
+        boost = boost == "1"
+    else:
+        no_turbo = _read_first_line(f"{CPUFREQ_ROOT}/intel_pstate/no_turbo")
+        boost = None if no_turbo is None else no_turbo == "0"
+    out[CPUBOOST_I] = "n/a" if boost is None else ("enabled" if boost else "disabled")
+    if boost:
+        logger.warning("CPU frequency boost is enabled. Timings may depend on the thermal state")
+
+    try:
+        freq = psutil.cpu_freq()
+    except Exception:
+        freq = None
+    out[CPUFREQ_I] = f"{freq.current:.0f}MHz (min {freq.min:.0f}MHz, max {freq.max:.0f}MHz)" if freq else "n/a"
+    return out
+
+
+class Isolation:
+    # setrlimit limits and a cgroup v2 group (cpu.max/memory.max) for the watched process.
+    # Anything the system doesn't permit is logged and skipped, the benchmark still runs
+
+    def __init__(self, cpulimit=None, memlimit=None, cgroupcpu=None, cgroupmem=None):
+        self.cpulimit = cpulimit
+        self.memlimit = memlimit
+        self.cgroupcpu = cgroupcpu
+        self.cgroupmem = cgroupmem
+        self.cgroup = None
+        self._parent = None
+        self._base = None
+        self._moved = False
+        self._enabled = []
+        self._delegated = []
+
+    @property
+    def enabled(self):
+        return any(x is not None for x in (self.cpulimit, self.memlimit, self.cgroupcpu, self.cgroupmem))
+
+    def setup(self):
+        if not self.enabled:
+            return
+        if sys.platform == 'win32':
+            logger.warning("Process isolation isn't supported on Windows. Ignored")
+            self.cpulimit = self.memlimit = self.cgroupcpu = self.cgroupmem = None
+            return
+        if self.cgroupcpu is not None or self.cgroupmem is not None:
+            self.cgroup = self._create_cgroup()
+
+    def _create_cgroup(self):
+        root = _cgroup2_root()
+        if not root:
+            logger.warning("cgroup v2 isn't mounted. cgroup limits ignored")
+            return None
+        # No internal processes: a group can't both hold processes and hand controllers to its children. benchmarkish
+        # moves itself to a leaf first, so the controllers can be enabled above the run group
+        #   <own>/benchmarkish.<pid>/supervisor  <- benchmarkish
+        #   <own>/benchmarkish.<pid>/run         <- the runs, with the limits
+        parent = f"{root}{_own_cgroup().rstrip('/')}"
+        self._parent = parent
+        self._base = f"{parent}/benchmarkish.{os.getpid()}"
+        needed = [c for c, limit in (("cpu", self.cgroupcpu), ("memory", self.cgroupmem)) if limit is not None]
+        available = (_read_first_line(f"{parent}/cgroup.controllers") or "").split()
+        missing = [c for c in needed if c not in available]
+        if missing:
+            logger.warning(f"cgroup controllers {missing} aren't delegated to {parent}. cgroup limits ignored")
+            return None
+        path = f"{self._base}/run"
+        try:
+            os.mkdir(self._base)
+            os.mkdir(f"{self._base}/supervisor")
+            _write(f"{self._base}/supervisor/cgroup.procs", str(os.getpid()))
+            self._moved = True
+            enabled = (_read_first_line(f"{parent}/cgroup.subtree_control") or "").split()
+            self._enabled = [c for c in needed if c not in enabled]
+            if self._enabled:
+                _write(f"{parent}/cgroup.subtree_control", " ".join(f"+{c}" for c in self._enabled))
+            _write(f"{self._base}/cgroup.subtree_control", " ".join(f"+{c}" for c in needed))
+            self._delegated = needed
+            os.mkdir(path)
+            if self.cgroupcpu is not None:
+                _write(f"{path}/cpu.max", f"{int(self.cgroupcpu * CGROUP_PERIOD)} {CGROUP_PERIOD}")
+            if self.cgroupmem is not None:
+                _write(f"{path}/memory.max", str(int(self.cgroupmem)))
+        except OSError:
+            logger.exception("Couldn't set up the cgroup. cgroup limits ignored")
+            self._remove_cgroup(path)
+            return None
+        logger.info(f"Runs are contained in cgroup {path}")
+        return path
+
+    def _remove_cgroup(self, path):
+        # Undoes whatever _create_cgroup got to, in reverse. A parent can't disable a controller its children still
+        # have enabled, so the base group gives them up first
+        for step in (lambda: os.rmdir(path),
+                     self._restore_base,
+                     self._restore_parent,
+                     lambda: os.rmdir(f"{self._base}/supervisor"),
+                     lambda: os.rmdir(self._base)):
+            try:
+                step()
+            except FileNotFoundError:
+                pass
+            except OSError:
+                logger.exception(f"Couldn't clean up cgroup {self._base}")
+                return
+
+    def _restore_base(self):
+        if self._delegated:
+            _write(f"{self._base}/cgroup.subtree_control", " ".join(f"-{c}" for c in self._delegated))
+            self._delegated = []
+
+    def _restore_parent(self):
+        if self._enabled:
+            _write(f"{self._parent}/cgroup.subtree_control", " ".join(f"-{c}" for c in self._enabled))
+            self._enabled = []
+        if self._moved:
+            _write(f"{self._parent}/cgroup.procs", str(os.getpid()))
+            self._moved = False
+
+    def preexec(self):
+        # Runs in the child, between fork and exec
+        if self.cpulimit is not None:
+            resource.setrlimit(resource.RLIMIT_CPU, (self.cpulimit, self.cpulimit))
+        if self.memlimit is not None:
+            resource.setrlimit(resource.RLIMIT_AS, (self.memlimit, self.memlimit))
+        if self.cgroup:
+            # Not caught: a run outside of its limits would be measured as if it was inside. Popen raises it in the
+            # parent and the run fails
+            _write(f"{self.cgroup}/cgroup.procs", str(os.getpid()))
+
+    def popen_kwargs(self):
+        return {'preexec_fn': self.preexec} if self.enabled else {}
+
+    def teardown(self):
+        if self.cgroup:
+            self._remove_cgroup(self.cgroup)
+            self.cgroup = None
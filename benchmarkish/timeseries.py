@@ -0,0 +1,95 @@
+import math
+import statistics
+from typing import List, Sequence, Tuple
+
+# A phase shorter than this many samples is just a spike
+MIN_PHASE_SAMPLES = 5
+MAX_PHASES = 8
+# Multiplies the BIC-like penalty paid by every new change point
+PHASE_PENALTY = 3.0
+
+
+def lttb(xs: Sequence[float], ys: Sequence[float], threshold: int) -> Tuple[List[float], List[float]]:
+    # Largest-Triangle-Three-Buckets: keeps the first and the last point, then from every bucket the point making the
+    # largest triangle with the previously kept one and the average of the next bucket. Peaks and steps survive
+    n = len(xs)
+    if threshold >= n or threshold < 3:
+        return list(xs), list(ys)
+    every = (n - 2) / (threshold - 2)
+    outx = [xs[0]]
+    outy = [ys[0]]
+    a = 0
+    for i in range(0, threshold - 2):
+        avg_start = int((i + 1) * every) + 1
+        avg_end = min(int((i + 2) * every) + 1, n)
+        avg_len = avg_end - avg_start
+        avg_x = sum(xs[avg_start:avg_end]) / avg_len
+        avg_y = sum(ys[avg_start:avg_end]) / avg_len
+
+        range_start = int(i * every) + 1
+        range_end = int((i + 1) * every) + 1
+        ax = xs[a]
+        ay = ys[a]
+        max_area = -1.0
+        chosen = range_start
+        for j in range(range_start, range_end):
+            area = abs((ax - avg_x) * (ys[j] - ay) - (ax - xs[j]) * (avg_y - ay))
+            if area > max_area:
+                max_area = area
+                chosen = j
+        outx.append(xs[chosen])
+        outy.append(ys[chosen])
+        a = chosen
+    outx.append(xs[n - 1])
+    outy.append(ys[n - 1])
+    return outx, outy
+
+
+def detect_phases(series: Sequence[Sequence[float]], min_size: int = MIN_PHASE_SAMPLES, max_phases: int = MAX_PHASES,
+                  penalty: float = PHASE_PENALTY) -> List[int]:
+    # Binary segmentation on the mean of every series (each one standardized, so CPU% and bytes weigh the same).
+    # Returns the exclusive end index of every phase, the last one is always len(series[0])
+    n = len(series[0]) if series else 0
+    if n < 2 * min_size:
+        return [n]
+    prefixes = []
+    for ys in series:
+        sd = statistics.pstdev(ys)
+        if not sd:
+            # A flat series can't tell phases apart
+            continue
+        mean = sum(ys) / n
+        s1 = [0.0]
+        s2 = [0.0]
+        for y in ys:
+            z = (y - mean) / sd
+            s1.append(s1[-1] + z)
+            s2.append(s2[-1] + z * z)
+        prefixes.append((s1, s2))
+    if not prefixes:
+        return [n]
+
+    def cost(start, end):
+        size = end - start
+        return sum((s2[end] - s2[start]) - (s1[end] - s1[start]) ** 2 / size for s1, s2 in prefixes)
+
+    threshold = penalty * len(prefixes) * math.log(n)
+    segments = [(0, n)]
+    breaks = []
+    while len(breaks) + 1 < max_phases:
+        best = None
+        for start, end in segments:
+            if end - start < 2 * min_size:
+                continue
+            total = cost(start, end)
+            for k in range(start + min_size, end - min_size + 1):
+                gain = total - cost(start, k) - cost(k, end)
+                if best is None or gain > best[0]:
+                    best = (gain, k, start, end)
+        if best is None or best[0] < threshold:
+            break
+        _, k, start, end = best
+        segments.remove((start, end))
+        segments.extend([(start, k), (k, end)])
+        breaks.append(k)
+    return sorted(breaks) + [n]
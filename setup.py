@@ -47,7 +47,7 @@ setup(
         # 'Programming Language :: Python :: 2.7',
         # 'Programming Language :: Python :: 3',
         # 'Programming Language :: Python :: 3.4',
-        'Programming Language :: Python :: 3.5',
+        'Programming Language :: Python :: 3.7',
         # 'Programming Language :: Python :: 3.6',
         # 'Programming Language :: Python :: 3.7',
         # 'Programming Language :: Python :: Implementation :: CPython',
@@ -65,7 +65,7 @@ setup(
     keywords=[
         # eg: 'keyword1', 'keyword2', 'keyword3',
     ],
-    python_requires='>=3.5',
+    python_requires='>=3.7',
     install_requires=[
         'psutil'
         # eg: 'aspectlib==1.1.1', 'six>=1.7',
@@ -84,6 +84,7 @@ setup(
     entry_points={
         'console_scripts': [
             'run-benchmarkish = benchmarkish.entry:main',
+            'benchmarkish-selfbench = benchmarkish.selfbench:main',
         ]
     },
 )
\ No newline at end of file